@@ -1,9 +1,21 @@
 import streamlit as st
 import pandas as pd
-import requests
-from io import StringIO
+import os
+import time
 import google.generativeai as genai
-import re
+from timber_engine.answer import answer_question
+from timber_engine.answer_cache import AnswerCache, conversation_key
+from timber_engine.data import DATA_STORE_DIR, DEFAULT_SPEC, KEY_COLS
+from timber_engine.dataset import (
+    DATASET_MAX_AGE_SECONDS, DATASET_PREFETCH_LEAD_SECONDS, DATASET_RETRY_SECONDS, DatasetStore, load_dataset,
+)
+from timber_engine.prompt import GEMINI_MODEL, build_gemini_history, build_system_prompt, data_period_bounds
+from timber_engine.query import (
+    QUERY_CACHE_SIZE, SANDBOX_MEMORY_LIMIT_MB, SANDBOX_TIMEOUT_SECONDS, SANDBOX_WORKERS,
+    QueryCache, QueryRunner,
+)
+from timber_engine.sandbox import SandboxPool
+from timber_engine.tracing import Trace, TraceLog, trace_span
 
 # Page config
 st.set_page_config(
@@ -12,11 +24,22 @@ st.set_page_config(
     layout="wide"
 )
 
+# Client-side options: UI_PERFORMANCE_MODE=0 restores the original mouse
+# and typewriter effects; UI_WEB_FONTS=0 skips Google Fonts (air-gapped
+# deployments fall back to the serif/monospace system fonts)
+UI_PERFORMANCE_MODE = os.environ.get('UI_PERFORMANCE_MODE', '1') != '0'
+UI_WEB_FONTS = os.environ.get('UI_WEB_FONTS', '1') != '0'
+
+if UI_WEB_FONTS:
+    st.markdown("""
+    <style>
+    @import url('https://fonts.googleapis.com/css2?family=Playfair+Display:wght@400;600;700;900&family=Vollkorn:wght@400;500;600;700&family=IBM+Plex+Mono:wght@400;500&display=swap');
+    </style>
+    """, unsafe_allow_html=True)
+
 # Custom CSS - REPLACE ENTIRE SECTION
 st.markdown("""
     <style>
-    @import url('https://fonts.googleapis.com/css2?family=Playfair+Display:wght@400;600;700;900&family=Vollkorn:wght@400;500;600;700&family=IBM+Plex+Mono:wght@400;500&display=swap');
-    
     :root {
         --forest-deep: #1a3a2e;
         --forest-mid: #2d5a47;
@@ -103,6 +126,25 @@ st.markdown("""
         border-left: 1px solid var(--sage);
     }
     
+    /* Bubble being streamed into: no entrance animation on every update */
+    .chat-message.streaming {
+        opacity: 1;
+        animation: none;
+    }
+    
+    /* Earlier messages re-emitted on a rerun: shown as they are, not animated again */
+    .chat-message.settled {
+        opacity: 1;
+        animation: none;
+    }
+    
+    .chat-message .timings {
+        font-family: 'IBM Plex Mono', monospace;
+        font-size: 0.7rem;
+        color: var(--sage);
+        margin-top: 0.75rem;
+    }
+    
     .chat-message::after {
         content: '';
         position: absolute;
@@ -398,7 +440,7 @@ st.markdown("""
     """, unsafe_allow_html=True)
 
 # JavaScript enhancements - ADD THIS NEW SECTION
-st.components.v1.html("""
+CLIENT_SCRIPT_HEAD = """
     <script>
     // Smooth scroll reveal animations
     const observerOptions = {
@@ -438,6 +480,10 @@ st.components.v1.html("""
         }
     });
     
+"""
+
+# Original effects: layout read per button on every mousemove, innerHTML per character
+CLIENT_EFFECTS_LEGACY = """
     // Magnetic effect for buttons
     document.addEventListener('mousemove', (e) => {
         document.querySelectorAll('.stButton > button').forEach(button => {
@@ -469,6 +515,56 @@ st.components.v1.html("""
         }, speed);
     }
     
+"""
+
+CLIENT_EFFECTS_LIGHT = """
+    // Magnetic effect for buttons: the listener only records the pointer;
+    // one frame reads every button position, then writes all transforms
+    let pointer = null;
+    let magnetFrame = null;
+    document.addEventListener('mousemove', (e) => {
+        pointer = { x: e.clientX, y: e.clientY };
+        if (magnetFrame === null) {
+            magnetFrame = window.requestAnimationFrame(() => {
+                magnetFrame = null;
+                const buttons = Array.from(document.querySelectorAll('.stButton > button'));
+                const rects = buttons.map(button => button.getBoundingClientRect());
+                buttons.forEach((button, i) => {
+                    const x = pointer.x - rects[i].left - rects[i].width / 2;
+                    const y = pointer.y - rects[i].top - rects[i].height / 2;
+                    const distance = Math.sqrt(x * x + y * y);
+                    
+                    if (distance < 100) {
+                        const strength = (100 - distance) / 100;
+                        button.style.transform = `translate(${x * strength * 0.2}px, ${y * strength * 0.2}px)`;
+                        button.dataset.magnet = '1';
+                    } else if (button.dataset.magnet) {
+                        button.style.transform = 'translate(0, 0)';
+                        delete button.dataset.magnet;
+                    }
+                });
+            });
+        }
+    }, { passive: true });
+    
+    // Typing indicator for AI responses: one text update per frame, sized
+    // to the elapsed time, instead of one innerHTML append per character
+    function typeWriter(element, text, speed = 30) {
+        const started = performance.now();
+        element.textContent = '';
+        const step = (now) => {
+            const shown = Math.min(text.length, Math.floor((now - started) / speed) + 1);
+            element.textContent = text.slice(0, shown);
+            if (shown < text.length) {
+                window.requestAnimationFrame(step);
+            }
+        };
+        window.requestAnimationFrame(step);
+    }
+    
+"""
+
+CLIENT_SCRIPT_TAIL = """
     // Add subtle particle effect on data reveals
     function createParticle(x, y) {
         const particle = document.createElement('div');
@@ -512,227 +608,118 @@ st.components.v1.html("""
         }
     });
     </script>
-""", height=0)
-
-# Data loading and processing
-@st.cache_data(ttl=3600)
-def load_and_process_data():
-    """Load and process Eurostat data"""
-    url = "https://ec.europa.eu/eurostat/api/comext/dissemination/sdmx/3.0/data/dataflow/ESTAT/ds-045409/1.0/*.*.*.*.*.*?c[freq]=M&c[reporter]=AT,BE,BG,CY,CZ,DE,DK,EE,ES,FI,FR,GB,GR,HR,HU,IE,IT,LT,LU,LV,MT,NL,PL,PT,RO,SE,SI,SK&c[partner]=CN,EG,SA,AE,MA,DZ,JP,KR,IN&c[product]=440711,440712,440713,440714,440719&c[flow]=2&c[indicators]=QUANTITY_IN_100KG,VALUE_IN_EUROS&c[TIME_PERIOD]=2024-01,2024-02,2024-03,2024-04,2024-05,2024-06,2024-07,2024-08,2024-09,2024-10,2024-11,2024-12,2025-01,2025-02,2025-03,2025-04,2025-05,2025-06,2025-07,2025-08&compress=false&format=csvdata&formatVersion=2.0"
-    
-    processing_log = []
-    
-    try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        
-        # Read CSV
-        df = pd.read_csv(StringIO(response.text))
-        processing_log.append(f"Raw CSV loaded: {len(df)} rows, {len(df.columns)} columns")
-        
-        # Make column names case-insensitive (lowercase)
-        df.columns = df.columns.str.lower()
-        
-        # Keep only needed columns
-        needed_cols = ['reporter', 'partner', 'product', 'indicators', 'time_period', 'obs_value']
-        available_cols = [col for col in needed_cols if col in df.columns]
-        processing_log.append(f"Available columns: {available_cols}")
-        
-        df = df[available_cols]
-        processing_log.append(f"After column filtering: {len(df)} rows")
-        
-        # Clean and standardize data
-        df['reporter'] = df['reporter'].astype(str).str.strip().str.upper()
-        df['partner'] = df['partner'].astype(str).str.strip().str.upper()
-        df['product'] = df['product'].astype(str).str.strip()
-        df['indicators'] = df['indicators'].astype(str).str.strip().str.upper()
-        df['time_period'] = df['time_period'].astype(str).str.strip()
-        df['obs_value'] = pd.to_numeric(df['obs_value'], errors='coerce').fillna(0)
-        
-        # Remove any rows with missing critical data
-        before_dropna = len(df)
-        df = df.dropna(subset=['reporter', 'partner', 'product', 'indicators', 'time_period'])
-        after_dropna = len(df)
-        processing_log.append(f"Dropped {before_dropna - after_dropna} rows with missing data")
-        processing_log.append(f"After cleaning: {len(df)} rows")
-        
-        # Product multipliers for CUM_VALUE calculation
-        multipliers = {
-            '440711': 0.1888,
-            '440712': 0.2128,
-            '440713': 0.2,
-            '440714': 0.2,
-            '440719': 0.2
-        }
-        
-        # Add CUM_VALUE rows (cubic meters)
-        quantity_rows = df[df['indicators'] == 'QUANTITY_IN_100KG'].copy()
-        processing_log.append(f"Found {len(quantity_rows)} QUANTITY_IN_100KG rows")
-        
-        quantity_rows['indicators'] = 'CUM_VALUE'
-        quantity_rows['obs_value'] = quantity_rows.apply(
-            lambda row: row['obs_value'] * multipliers.get(str(row['product']), 0.2),
-            axis=1
-        )
-        
-        # Concatenate to have CUM_VALUE available
-        df = pd.concat([df, quantity_rows], ignore_index=True)
-        processing_log.append(f"After adding CUM_VALUE: {len(df)} rows")
-        
-        # Add UNIT_VALUE rows (price per cubic meter)
-        value_rows = df[df['indicators'] == 'VALUE_IN_EUROS'].copy()
-        processing_log.append(f"Found {len(value_rows)} VALUE_IN_EUROS rows")
-        
-        unit_value_rows = []
-        skipped_count = 0
-        
-        for _, value_row in value_rows.iterrows():
-            # Find corresponding CUM_VALUE
-            cum_value_row = df[
-                (df['reporter'] == value_row['reporter']) &
-                (df['partner'] == value_row['partner']) &
-                (df['product'] == value_row['product']) &
-                (df['time_period'] == value_row['time_period']) &
-                (df['indicators'] == 'CUM_VALUE')
-            ]
-            
-            new_row = value_row.copy()
-            new_row['indicators'] = 'UNIT_VALUE'
-            
-            if cum_value_row.empty or cum_value_row.iloc[0]['obs_value'] == 0:
-                # Set to NaN/0 instead of skipping
-                new_row['obs_value'] = 0  # or use float('nan')
-                skipped_count += 1
-            else:
-                new_row['obs_value'] = value_row['obs_value'] / cum_value_row.iloc[0]['obs_value']
-            
-            unit_value_rows.append(new_row)
-        
-        if unit_value_rows:
-            df = pd.concat([df, pd.DataFrame(unit_value_rows)], ignore_index=True)
-            processing_log.append(f"Added {len(unit_value_rows)} UNIT_VALUE rows ({skipped_count} with zero/missing volume)")
-            
-        return df
-    
-    except Exception as e:
-        st.error(f"❌ Error loading data: {str(e)}")
-        if processing_log:
-            st.error(f"Processing log: {processing_log}")
-        return None
-        
-# System prompt for Gemini
-SYSTEM_PROMPT = """You're a top-notch, seasoned industry analyst with excellent analytic skills, logic and journalistic, neutral style. You work with us as a helpful analyst who addresses the statistics database for EU softwood timber exports to global countries in order to answer user's queries. Your knowledge is limited outside this database.
-
-You're very clever, thoughtful and reflect multi-directionally. When asked, you think first meticulously which rows and cells to look at, and construct a short Python code snippet that will query the dataframe 'df'.
-
-Country labels (Reporter - use uppercase codes):
-AT=Austria, BE=Belgium, BG=Bulgaria, CY=Cyprus, CZ=Czech Republic, DE=Germany, DK=Denmark, EE=Estonia, ES=Spain, FI=Finland, FR=France, GB=United Kingdom, GR=Greece, HR=Croatia, HU=Hungary, IE=Ireland, IT=Italy, LT=Lithuania, LU=Luxembourg, LV=Latvia, MT=Malta, NL=Netherlands, PL=Poland, PT=Portugal, RO=Romania, SE=Sweden, SI=Slovenia, SK=Slovakia
+"""
 
-Species labels (Product - use as strings):
-440711=pine, 440712=spruce and fir, 440713=SPF, 440714=hemlock and fir, 440719=other softwoods
+st.components.v1.html(
+    CLIENT_SCRIPT_HEAD
+    + (CLIENT_EFFECTS_LIGHT if UI_PERFORMANCE_MODE else CLIENT_EFFECTS_LEGACY)
+    + CLIENT_SCRIPT_TAIL,
+    height=0
+)
 
-Importing country labels (Partner - use uppercase codes):
-CN=China, EG=Egypt, SA=Saudi Arabia, AE=UAE, MA=Morocco, DZ=Algeria, JP=Japan, KR=South Korea, IN=India
+# Engine objects shared by every session of this server process
 
-Indicators (use uppercase):
-- QUANTITY_IN_100KG: Export quantity in 100kg units
-- VALUE_IN_EUROS: Export value in euros
-- CUM_VALUE: Cubic meters (calculated from quantity)
-- UNIT_VALUE: Price per cubic meter in EUR/m³ (calculated from value/volume)
+# Finished turn and load traces, one JSON object per line, when TRACE_LOG is
+# set to a file path; they include question texts. The file is rotated once
+# it reaches TRACE_LOG_MAX_MB
+TRACE_LOG_PATH = os.environ.get('TRACE_LOG', '')
+TRACE_LOG_MAX_BYTES = int(float(os.environ.get('TRACE_LOG_MAX_MB', 10)) * 1024 * 1024)
 
-The database has stats for all EU countries, all softwood lumber species, exports volume and value to China, Top-5 MENA countries, India, Japan, South Korea; monthly from January 2024 to August 2025.
+@st.cache_resource
+def get_trace_log():
+    return TraceLog(TRACE_LOG_PATH, TRACE_LOG_MAX_BYTES) if TRACE_LOG_PATH else None
 
-DataFrame columns: reporter, partner, product, indicators, time_period, obs_value
+@st.cache_resource
+def get_query_runner():
+    sandbox_pool = None
+    if SANDBOX_WORKERS > 0:
+        sandbox_pool = SandboxPool(
+            SANDBOX_WORKERS, DATA_STORE_DIR / 'snapshots', KEY_COLS,
+            timeout_seconds=SANDBOX_TIMEOUT_SECONDS, memory_limit_mb=SANDBOX_MEMORY_LIMIT_MB
+        )
+    return QueryRunner(QueryCache(QUERY_CACHE_SIZE), sandbox_pool)
 
-IMPORTANT INSTRUCTIONS:
-1. Generate concise Python code using pandas operations on 'df'
-2. Assign results to a variable called 'result'
-3. Use uppercase for reporter, partner, and indicators when filtering
-4. Use string format for product codes (e.g., '440711')
-5. When interpreting results, use ONLY the actual executed result - never make up numbers
-6. If data is missing or you can't answer, say so clearly
-7. When asked about imports or import volumes (and value or tons not mentioned), by default answer about m³ and change only if corrected by user
-8. When asked about trends, try giving annual or year-to-date numbers and comparisons on a YoY basis, not just random number of recent months
+@st.cache_resource
+def get_answer_cache():
+    return AnswerCache()
 
-Example code:
-```result = df[(df['reporter'] == 'DE') & (df['indicators'] == 'CUM_VALUE') & (df['partner'] == 'CN')]['obs_value'].sum()```
-"""
+@st.cache_resource
+def get_dataset_store():
+    # Resolved here, in a script run, because the refresher thread has no Streamlit context
+    query_runner = get_query_runner()
+    trace_log = get_trace_log()
+    # The first load starts in the background now; sessions that arrive meanwhile wait for it
+    return DatasetStore(
+        lambda revalidate: load_dataset(DEFAULT_SPEC, query_runner, trace_log, revalidate),
+        DATASET_MAX_AGE_SECONDS,
+        retry_seconds=DATASET_RETRY_SECONDS,
+        prefetch=True,
+        prefetch_lead_seconds=DATASET_PREFETCH_LEAD_SECONDS,
+        # Only caches keyed on the data go; the extras cache and answer cache are keyed by version
+        on_swap=lambda previous, dataset: query_runner.cache.clear(),
+    )
 
 # Initialize Gemini
 @st.cache_resource
-def init_gemini():
+def init_gemini(system_prompt):
+    """Gemini model with the system prompt set once as its system instruction"""
     api_key = st.secrets.get("GEMINI_API_KEY", "")
     if not api_key:
         st.error("⚠️ Please add GEMINI_API_KEY to your Streamlit secrets!")
         st.stop()
     
     genai.configure(api_key=api_key)
-    return genai.GenerativeModel('gemini-2.5-pro')
-
-# Add this function after the init_gemini() function
-def build_gemini_history(messages):
-    """Convert stored messages to Gemini chat history format"""
-    history = []
-    for msg in messages:
-        # Gemini uses 'user' and 'model' roles, and 'parts' for content
-        role = 'user' if msg['role'] == 'user' else 'model'
-        history.append({
-            'role': role,
-            'parts': [msg['content']]
-        })
-    return history
-    
-# Execute code safely
-def execute_code(code_str, df):
-    """Safely execute code generated by AI"""
-    try:
-        local_vars = {'df': df, 'pd': pd}
-        exec(code_str, {"__builtins__": {}}, local_vars)
-        if 'result' in local_vars:
-            return local_vars['result']
-        return None
-    except Exception as e:
-        return f"⚠️ Error executing code: {str(e)}"
-
-# Process AI response
-def process_ai_response(response_text, df):
-    """Extract and execute code from AI response"""
-    # Find Python code blocks
-    code_blocks = re.findall(r'```python\n(.*?)\n```', response_text, re.DOTALL)
-    
-    formatted_response = response_text
-    
-    for code in code_blocks:
-        result = execute_code(code, df)
-        if result is not None and isinstance(result, (int, float)):
-            # Format the result properly
-            try:
-                if isinstance(result, float):
-                    formatted_result = f"{result:,.2f}"
-                else:
-                    formatted_result = f"{result:,}"
-                
-                # Replace code block with collapsible version
-                formatted_response = formatted_response.replace(
-                    f"```python\n{code}\n```",
-                    f"<details><summary>📊 View query code</summary>\n\n```python\n{code}\n```\n</details>\n\n💡 **Result:** `{formatted_result}`"
-                )
-            except:
-                pass
-    
-    return formatted_response
-    
+    return genai.GenerativeModel(GEMINI_MODEL, system_instruction=system_prompt)
+
+def format_answer(narrative, code=None, result=None):
+    """Assistant message: collapsible query code and result above the narrative"""
+    if code is None:
+        return narrative
+    return f"""<details><summary>📊 View query code</summary>
+
+```python
+{code}
+```
+</details>
+
+💡 **Result:** `{result}`
+
+{narrative}"""
+
 # Initialize session state
-if 'df' not in st.session_state:
-    with st.spinner('📥 Loading Eurostat data...'):
-        st.session_state.df = load_and_process_data()
+# The dataset is shared by all sessions; this run keeps the version that is current now
+dataset_store = get_dataset_store()
+data_wait_started = time.perf_counter()
+with st.spinner('📥 Loading Eurostat data...'):
+    dataset = dataset_store.current()
+data_wait_seconds = time.perf_counter() - data_wait_started
+df, wide_df, data_version = (dataset.df, dataset.wide_df, dataset.version) if dataset else (None, None, None)
 
-if 'model' not in st.session_state:
-    st.session_state.model = init_gemini()
+if dataset is None and dataset_store.last_error is not None:
+    st.error(f"❌ Error loading data: {dataset_store.last_error}")
+    processing_log = getattr(dataset_store.last_error, 'processing_log', None)
+    if processing_log:
+        st.error(f"Processing log: {processing_log}")
+
+if 'model' not in st.session_state or st.session_state.model_version != data_version:
+    st.session_state.model = init_gemini(build_system_prompt(df))
+    st.session_state.model_version = data_version
 
 if 'messages' not in st.session_state:
     st.session_state.messages = []
 
+if 'single_call' not in st.session_state:
+    st.session_state.single_call = False
+
+if 'debug_panel' not in st.session_state:
+    st.session_state.debug_panel = False
+
+# Only the latest messages are rendered; earlier ones are loaded on request
+CHAT_VISIBLE_MESSAGES = int(os.environ.get('CHAT_VISIBLE_MESSAGES', 20))
+
+if 'visible_messages' not in st.session_state:
+    st.session_state.visible_messages = CHAT_VISIBLE_MESSAGES
+
 # UI Layout
 st.title("🌲 EU Timber Export Analyst")
 st.markdown("<p style='font-family: \"IBM Plex Mono\", monospace; color: #6b4423; font-size: 0.85rem; font-weight: 500; margin-top: -1rem; letter-spacing: 0.1em; text-transform: uppercase;'>Powered by Gemini 2.5 Pro • Eurostat COMEXT</p>", unsafe_allow_html=True)
@@ -740,7 +727,8 @@ st.markdown("<p style='font-family: \"IBM Plex Mono\", monospace; color: #6b4423
 # Sidebar
 with st.sidebar:
     st.header("📊 Database Coverage")
-    st.markdown("""
+    period_start, period_end = data_period_bounds(df)
+    st.markdown(f"""
     **Geographic Coverage:**
     - 🇪🇺 All EU-27 + UK
     - 🌍 9 partner countries
@@ -753,7 +741,7 @@ with st.sidebar:
     - 🌲 Other softwoods (440719)
     
     **Period:**
-    - 📅 Jan 2024 - Aug 2025
+    - 📅 {period_start.strftime('%b %Y')} - {period_end.strftime('%b %Y')}
     - 📊 Monthly data
     
     **Metrics:**
@@ -767,29 +755,96 @@ with st.sidebar:
     col1, col2 = st.columns(2)
     with col1:
         if st.button("🔄 Refresh", use_container_width=True):
-            st.cache_data.clear()
-            st.session_state.df = load_and_process_data()
-            st.rerun()
+            dataset_store.request_refresh()
     with col2:
         if st.button("🗑️ Clear", use_container_width=True):
             st.session_state.messages = []
+            st.session_state.visible_messages = CHAT_VISIBLE_MESSAGES
             st.rerun()
+    
+    if dataset is not None:
+        refreshed_at = time.strftime('%H:%M', time.localtime(dataset_store.refreshed_at))
+        st.caption(f"🗂️ Data version {data_version} · last refresh {refreshed_at}")
+    if dataset_store.refreshing:
+        st.caption("🔄 Refreshing data in the background; new questions switch over when it is ready.")
+    elif dataset_store.last_error is not None and dataset is not None:
+        st.caption(f"⚠️ Last refresh failed, still serving version {data_version}: {dataset_store.last_error}")
+    
+    cache_stats = get_query_runner().cache.stats()
+    st.caption(
+        f"⚡ Query cache: {cache_stats['hits']} hits · {cache_stats['misses']} misses · "
+        f"{cache_stats['size']}/{cache_stats['maxsize']} entries"
+    )
+    st.toggle(
+        "⚡ Single-call answers",
+        key='single_call',
+        help="Ask Gemini for code and a narrative template in one call; falls back to a second call for non-numeric results."
+    )
+    st.caption("♻️ Repeated questions are answered from cache; start a question with ! to ask Gemini afresh.")
+    render_stats_placeholder = st.empty()
+    st.toggle(
+        "🐞 Debug panel",
+        key='debug_panel',
+        help="Show where the last turn and the last data load spent their time."
+    )
+    debug_placeholder = st.empty()
             
 # Chat messages
-for message in st.session_state.messages:
-    role_class = "user" if message["role"] == "user" else "assistant"
-    role_icon = "👤" if message["role"] == "user" else "🤖"
+def render_message_html(role, content, timings=None, streaming=False, settled=False):
+    """Chat bubble markup for one message; settled bubbles skip the entrance animation"""
+    role_class = "user" if role == "user" else "assistant"
+    role_icon = "👤" if role == "user" else "🤖"
+    extra_class = " streaming" if streaming else " settled" if settled else ""
+    timings_html = ""
+    if timings:
+        tokens_note = ""
+        if 'prompt_tokens' in timings:
+            tokens_note = f' · {timings["prompt_tokens"]:,} prompt tokens'
+        timings_html = (
+            f'<div class="timings">⏱ first token {timings["first_token"]:.2f}s · '
+            f'total {timings["total"]:.2f}s{tokens_note}</div>'
+        )
     
-    st.markdown(f"""
-        <div class="chat-message {role_class}">
-            <div class="role">{role_icon} {message["role"].title()}</div>
-            <div class="message">{message["content"]}</div>
+    return f"""
+        <div class="chat-message {role_class}{extra_class}">
+            <div class="role">{role_icon} {role.title()}</div>
+            <div class="message">{content}</div>
+            {timings_html}
         </div>
-    """, unsafe_allow_html=True)
+    """
+
+def show_earlier_messages():
+    st.session_state.visible_messages += CHAT_VISIBLE_MESSAGES
+
+@st.fragment
+def render_transcript(messages):
+    """Earlier messages; 'show earlier' reruns only this fragment, not the page"""
+    hidden = max(len(messages) - st.session_state.visible_messages, 0)
+    if hidden:
+        st.button(
+            f"⬆️ Show earlier messages ({hidden} hidden)",
+            on_click=show_earlier_messages,
+            use_container_width=True,
+        )
+    for message in messages[hidden:]:
+        st.markdown(
+            render_message_html(message["role"], message["content"], message.get("timings"), settled=True),
+            unsafe_allow_html=True
+        )
+
+render_started = time.perf_counter()
+render_transcript(st.session_state.messages)
+transcript_render_seconds = time.perf_counter() - render_started
+render_stats_placeholder.caption(
+    f"🖥️ Transcript: {min(len(st.session_state.messages), st.session_state.visible_messages)} "
+    f"of {len(st.session_state.messages)} messages "
+    f"rendered in {transcript_render_seconds * 1000:.1f} ms"
+)
 
 # Welcome message - REPLACE
+welcome_placeholder = st.empty()
 if not st.session_state.messages:
-    st.markdown("""
+    welcome_placeholder.markdown("""
         <div class="chat-message assistant">
             <div class="role">AI Analyst</div>
             <div class="message">
@@ -811,88 +866,127 @@ if not st.session_state.messages:
     
 # Chat input
 if prompt := st.chat_input("💬 Ask about timber exports..."):
-    if st.session_state.df is None:
+    if df is None:
         st.error("❌ Data not loaded. Please refresh the page.")
         st.stop()
     
     # Add user message
     st.session_state.messages.append({"role": "user", "content": prompt})
     
-    # Display user message
-    st.markdown(f"""
-        <div class="chat-message user">
-            <div class="role">👤 User</div>
-            <div class="message">{prompt}</div>
-        </div>
-    """, unsafe_allow_html=True)
-    
-    # Generate AI response
-    with st.spinner("🔍 Analyzing data..."):
-        try:
-            # BUILD HISTORY FROM STORED MESSAGES (excluding the just-added user message)
-            history = build_gemini_history(st.session_state.messages[:-1])
-            chat = st.session_state.model.start_chat(history=history)
-            
-            # Step 1: Get code from AI
-            code_prompt = f"""{SYSTEM_PROMPT}
-
-User question: {prompt}
-
-Generate ONLY the Python code to answer this question. Do not include explanations yet.
-Assign the final result to a variable called 'result'.
-"""
-            code_response = chat.send_message(code_prompt)
-            
-            # Step 2: Extract and execute code
-            code_blocks = re.findall(r'```python\n(.*?)\n```', code_response.text, re.DOTALL)
-            
-            if code_blocks:
-                code = code_blocks[0]
-                execution_result = execute_code(code, st.session_state.df)
-                
-                # Step 3: Ask AI to formulate response using ACTUAL result
-                interpretation_prompt = f"""The code executed successfully and returned this result: {execution_result}
-
-User's question was: {prompt}
-
-Now provide a clear, natural language answer using this EXACT result. Include:
-1. A direct answer to the question
-2. The actual number from the result: {execution_result}
-3. Appropriate units and context. Be precise, but narrative: remember you're a top-notch analyst with excellent editorial skills and well-developed logic. Your user is likely well-familiar with timber market and wants data-driven insights.
-4. Do NOT make up any numbers - use only the result provided: {execution_result}
-
-Keep it concise and professional."""
-                
-                final_response = chat.send_message(interpretation_prompt)
+    # Display user message below the transcript already on screen; no rerun
+    # afterwards, so the earlier messages are not emitted a second time
+    welcome_placeholder.empty()
+    st.markdown(render_message_html("user", prompt), unsafe_allow_html=True)
+    response_placeholder = st.empty()
+    
+    # A leading "!" skips the answer cache for this question
+    bypass_answer_cache = prompt.startswith('!')
+    question = prompt[1:].strip() if bypass_answer_cache else prompt
+    trace = Trace(
+        'turn', question=question, data_version=data_version,
+        single_call=st.session_state.single_call, sandboxed=SANDBOX_WORKERS > 0,
+        transcript_messages=len(st.session_state.messages), transcript_render=transcript_render_seconds,
+    )
+    # The history the model would see (without the just-added user message);
+    # answers are cached per conversation so follow-ups are not mixed up
+    history = build_gemini_history(st.session_state.messages[:-1])
+    context = conversation_key(history)
+    with trace_span(trace, 'answer_cache') as span:
+        cached_answer = None if bypass_answer_cache else get_answer_cache().get(question, data_version, context)
+        span['hit'] = cached_answer is not None
+    
+    if cached_answer is not None:
+        st.session_state.messages.append({
+            "role": "assistant",
+            "content": format_answer(**cached_answer) + "\n\n<sub>♻️ Answered from cache</sub>"
+        })
+    else:
+        # Generate AI response, streaming the narrative into the assistant bubble
+        turn_started = time.perf_counter()
+        first_token_at = []
+        
+        def show_partial_answer(text):
+            if not first_token_at:
+                first_token_at.append(time.perf_counter())
+            response_placeholder.markdown(
+                render_message_html("assistant", text, streaming=True),
+                unsafe_allow_html=True
+            )
+        
+        with st.spinner("🔍 Analyzing data..."):
+            try:
+                chat = st.session_state.model.start_chat(history=history)
                 
-                # Format final output
-                if isinstance(execution_result, (int, float)):
-                    if isinstance(execution_result, float):
-                        formatted_result = f"{execution_result:,.2f}"
-                    else:
-                        formatted_result = f"{execution_result:,}"
-                else:
-                    formatted_result = str(execution_result)
+                usage = {}
+                answer, cacheable = answer_question(
+                    chat, question,
+                    lambda code: get_query_runner().run(code, df, wide_df, data_version),
+                    single_call=st.session_state.single_call,
+                    on_text=show_partial_answer,
+                    usage=usage,
+                    trace=trace,
+                )
+                turn_finished = time.perf_counter()
+                timings = {
+                    'first_token': (first_token_at[0] if first_token_at else turn_finished) - turn_started,
+                    'total': turn_finished - turn_started,
+                    **usage,
+                }
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": format_answer(**answer),
+                    "timings": timings,
+                })
+                if cacheable:
+                    get_answer_cache().put(question, data_version, answer, context)
                 
-                full_response = f"""<details><summary>📊 View query code</summary>
-
-```python
-{code}
-```
-</details>
+            except Exception as e:
+                error_msg = f"❌ Error: {str(e)}"
+                st.session_state.messages.append({"role": "assistant", "content": error_msg})
+                trace.attrs['error'] = str(e)
+    
+    answer_message = st.session_state.messages[-1]
+    with trace_span(trace, 'render'):
+        response_placeholder.markdown(
+            render_message_html("assistant", answer_message["content"], answer_message.get("timings")),
+            unsafe_allow_html=True
+        )
+    
+    trace.attrs.update(answer_message.get("timings", {}))
+    trace.finish()
+    st.session_state.last_trace = trace.to_dict()
+    trace_log = get_trace_log()
+    if trace_log is not None:
+        trace_log.write(trace)
 
-💡 **Result:** `{formatted_result}`
+# Debug panel, filled last so it includes the turn that just finished
+def trace_table(trace_dict):
+    """One row per span: offset and duration in ms, other attributes as text"""
+    rows = []
+    for span in trace_dict['spans']:
+        details = {k: v for k, v in span.items() if k not in ('name', 'start', 'duration')}
+        rows.append({
+            'span': span['name'],
+            'start ms': round(span['start'] * 1000, 1),
+            'duration ms': round(span['duration'] * 1000, 1),
+            'details': ', '.join(f"{k}={v}" for k, v in details.items()),
+        })
+    return pd.DataFrame(rows, columns=['span', 'start ms', 'duration ms', 'details'])
 
-{final_response.text}"""
-                
-                st.session_state.messages.append({"role": "assistant", "content": full_response})
-            else:
-                # No code generated - direct response
-                direct_response = chat.send_message(f"{SYSTEM_PROMPT}\n\nUser question: {prompt}")
-                st.session_state.messages.append({"role": "assistant", "content": direct_response.text})
-            
-        except Exception as e:
-            error_msg = f"❌ Error: {str(e)}"
-            st.session_state.messages.append({"role": "assistant", "content": error_msg})
-    
-    st.rerun()
+if st.session_state.debug_panel:
+    with debug_placeholder.container():
+        last_trace = st.session_state.get('last_trace')
+        if last_trace is not None:
+            st.caption(f"Last turn: {last_trace['duration'] * 1000:.0f} ms")
+            st.dataframe(trace_table(last_trace), hide_index=True, use_container_width=True)
+        if dataset_store.ready_seconds is not None:
+            st.caption(
+                f"Startup: data ready {dataset_store.ready_seconds * 1000:.0f} ms after the store was created; "
+                f"this run waited {data_wait_seconds * 1000:.0f} ms"
+            )
+        if dataset is not None and dataset.trace is not None:
+            load_trace = dataset.trace.to_dict()
+            st.caption(f"Data load {data_version}: {load_trace['duration'] * 1000:.0f} ms")
+            st.dataframe(trace_table(load_trace), hide_index=True, use_container_width=True)
+        if TRACE_LOG_PATH:
+            st.caption(f"Traces are appended to {TRACE_LOG_PATH}")
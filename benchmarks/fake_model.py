@@ -0,0 +1,86 @@
+"""Deterministic stand-in for the Gemini chat model.
+
+FakeModel.start_chat returns a chat whose send_message answers the prompts
+answer_question sends: canned code for the questions in QUESTION_CORPUS
+(in both the two-step and the single-call format), a fixed narrative for
+interpretation prompts, and plain text for unknown questions. Token counts
+are estimated from text length; latency_seconds delays every call and
+streamed responses arrive in a few chunks.
+"""
+import re
+import time
+from types import SimpleNamespace
+
+# (question, code) pairs covering the query shapes the system prompt asks for
+QUESTION_CORPUS = [
+    ("What are Germany's total pine exports to China in 2024?",
+     "result = annual_total('CUM_VALUE', 2024, reporter='DE', partner='CN', product='440711')"),
+    ("Which EU country exported the most spruce to Egypt?",
+     "result = rank_reporters('EG', product='440712', top=1)"),
+    ("Show me average unit prices for Finnish exports to Japan",
+     "result = ytd_total('UNIT_VALUE', reporter='FI', partner='JP')"),
+    ("Compare Swedish and Austrian exports to Saudi Arabia",
+     "result = rank_reporters('SA').loc[['SE', 'AT']]"),
+    ("What's the trend for Poland's exports in 2024?",
+     "result = rolling_sum('CUM_VALUE', 3, reporter='PL')"),
+    ("How did German exports to China change year on year?",
+     "result = yoy_change('CUM_VALUE', reporter='DE', partner='CN')['pct_change']"),
+    ("Top partners for Swedish spruce by volume",
+     "rows = df[(df['reporter'] == 'SE') & (df['product'] == '440712') & (df['indicators'] == 'CUM_VALUE')]\n"
+     "result = rows.groupby('partner', observed=True)['obs_value'].sum().nlargest(3)"),
+    ("Total export value of all EU countries",
+     "result = wide_df['VALUE_IN_EUROS'].sum()"),
+    ("Quarterly volumes of Latvian exports to India",
+     "result = cubes[('quarter', ('reporter', 'partner'))].loc[('LV', 'IN'), 'CUM_VALUE']"),
+]
+
+CANNED_CODE = dict(QUESTION_CORPUS)
+NARRATIVE = "Exports came to {result} over the period, in line with the seasonal pattern."
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+class FakeResponse(list):
+    """Streamed chunks, plus .text and .usage_metadata like a Gemini response"""
+    
+    def __init__(self, text, prompt, chunks=1):
+        size = max(1, -(-len(text) // chunks))
+        super().__init__(SimpleNamespace(text=text[i:i + size]) for i in range(0, len(text), size))
+        self.text = text
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=estimate_tokens(prompt), candidates_token_count=estimate_tokens(text)
+        )
+
+class FakeChat:
+    def __init__(self, history=None, latency_seconds=0.0):
+        self.history = list(history or [])
+        self.latency_seconds = latency_seconds
+    
+    def send_message(self, prompt, stream=False):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        text = self.reply(prompt)
+        self.history.append({'role': 'user', 'parts': [prompt]})
+        self.history.append({'role': 'model', 'parts': [text]})
+        return FakeResponse(text, prompt, chunks=8 if stream else 1)
+    
+    def reply(self, prompt):
+        if 'returned this result:' in prompt:
+            result = re.search(r'returned this result: (.*?)\n', prompt).group(1)
+            return NARRATIVE.replace('{result}', result)
+        question = re.search(r'User question: (.*)', prompt).group(1).strip()
+        code = CANNED_CODE.get(question)
+        if code is None:
+            return "That is outside what the database covers."
+        if 'Reply with exactly two fenced blocks' in prompt:
+            return f"```python\n{code}\n```\n```narrative\n{NARRATIVE}\n```"
+        if 'Generate ONLY the Python code' in prompt:
+            return f"```python\n{code}\n```"
+        return "That is outside what the database covers."
+
+class FakeModel:
+    def __init__(self, latency_seconds=0.0):
+        self.latency_seconds = latency_seconds
+    
+    def start_chat(self, history=None):
+        return FakeChat(history, self.latency_seconds)
@@ -0,0 +1,121 @@
+"""Synthetic COMEXT csvdata and a local server that stands in for the API.
+
+Rows per month are reporters x partners x products x 2 indicators, so the
+real scope (28 x 9 x 5) gives 2,520 rows a month; raising partners past
+the nine real ones adds synthetic partner codes to reach millions of rows.
+Each month is generated once from its own seed, so a payload is the same
+across runs and across chunkings of the same months.
+"""
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import numpy as np
+import pandas as pd
+
+REPORTERS = (
+    'AT BE BG CY CZ DE DK EE ES FI FR GB GR HR HU IE IT LT LU LV MT NL PL PT RO SE SI SK'
+).split()
+PARTNERS = ('CN', 'EG', 'SA', 'AE', 'MA', 'DZ', 'JP', 'KR', 'IN')
+PRODUCTS = ('440711', '440712', '440713', '440714', '440719')
+CSV_HEADER = 'DATAFLOW,freq,reporter,partner,product,flow,indicators,TIME_PERIOD,OBS_VALUE,OBS_FLAG\n'
+
+def partner_codes(count):
+    """The real partners first, then synthetic codes P001, P002, ..."""
+    synthetic = [f"P{i:03d}" for i in range(1, max(count - len(PARTNERS), 0) + 1)]
+    return (list(PARTNERS) + synthetic)[:count]
+
+def month_rows(period, partners=len(PARTNERS)):
+    """csvdata body (no header) for one month"""
+    seed = int(hashlib.sha256(f"{period}:{partners}".encode()).hexdigest()[:8], 16)
+    rng = np.random.default_rng(seed)
+    keys = pd.MultiIndex.from_product(
+        [REPORTERS, partner_codes(partners), PRODUCTS], names=['reporter', 'partner', 'product']
+    ).to_frame(index=False)
+    quantity = np.round(rng.gamma(0.6, 900, len(keys)), 1)
+    value = np.round(quantity * rng.uniform(15, 40, len(keys)), 0)
+    
+    frames = []
+    for indicator, values in (('QUANTITY_IN_100KG', quantity), ('VALUE_IN_EUROS', value)):
+        frame = keys.copy()
+        frame.insert(0, 'DATAFLOW', 'ESTAT:DS-045409(1.0)')
+        frame.insert(1, 'freq', 'M')
+        frame['flow'] = 2
+        frame['indicators'] = indicator
+        frame['TIME_PERIOD'] = period
+        frame['OBS_VALUE'] = values
+        frame['OBS_FLAG'] = ''
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True).to_csv(index=False, header=False)
+
+class CsvdataFixture:
+    """Cached per-month payloads for one scale"""
+    
+    def __init__(self, partners=len(PARTNERS)):
+        self.partners = partners
+        self._months = {}
+        self._lock = threading.Lock()
+    
+    def month(self, period):
+        with self._lock:
+            if period not in self._months:
+                self._months[period] = month_rows(period, self.partners).encode()
+            return self._months[period]
+    
+    def payload(self, periods):
+        """Complete csvdata document for the given months"""
+        return CSV_HEADER.encode() + b''.join(self.month(period) for period in periods)
+    
+    def rows_per_month(self):
+        return len(REPORTERS) * self.partners * len(PRODUCTS) * 2
+
+class FixtureServer:
+    """Local HTTP server answering csvdata requests the way COMEXT does.
+    
+    Point COMEXT_API_BASE at .base_url. Responses carry an ETag per request
+    URL and honour If-None-Match; requests counts the requests served.
+    """
+    
+    def __init__(self, fixture):
+        self.fixture = fixture
+        self.requests = 0
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                query = unquote(self.path.split('?', 1)[1]) if '?' in self.path else ''
+                params = dict(part.split('=', 1) for part in query.split('&') if '=' in part)
+                periods = params.get('c[TIME_PERIOD]', '').split(',')
+                etag = '"' + hashlib.sha256(self.path.encode()).hexdigest()[:16] + '"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                body = server.fixture.payload(periods)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/csv')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+    
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+    
+    def __enter__(self):
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
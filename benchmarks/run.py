@@ -0,0 +1,253 @@
+"""Offline benchmarks: data load, code execution and question-to-answer pipeline.
+
+Runs without Streamlit, network access or a Gemini key. COMEXT is replaced
+by a local server with synthetic csvdata (benchmarks.fixtures) and Gemini
+by a deterministic fake (benchmarks.fake_model):
+
+    python -m benchmarks.run --label before
+    python -m benchmarks.run --label after --baseline benchmarks/results/<before>.json
+    python -m benchmarks.run --partners 400 --months 24   # ~2.7M rows
+
+Every run writes a JSON report (median/min/max milliseconds per benchmark,
+plus parameters and environment) to benchmarks/results/ and prints it as a
+table, next to the baseline's medians when --baseline is given.
+"""
+import argparse
+import dataclasses
+import io
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.fake_model import QUESTION_CORPUS, FakeModel
+from benchmarks.fixtures import CsvdataFixture, FixtureServer
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def timed(fn, repeat):
+    """Wall-clock samples of repeat calls and the last result"""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return samples, result
+
+def summarize(samples, **extra):
+    ms = sorted(sample * 1000 for sample in samples)
+    return {
+        'median_ms': statistics.median(ms), 'min_ms': ms[0], 'max_ms': ms[-1], 'runs': len(ms), **extra
+    }
+
+def _parse_in_child(payload_path, streaming, conn):
+    """Parse one payload in a fresh process and report time, rows and peak RSS"""
+    from timber_engine.data import parse_csvdata
+    
+    baseline_rss = peak_rss_mb()
+    started = time.perf_counter()
+    if streaming:
+        with open(payload_path, 'rb') as f:
+            rows = len(parse_csvdata(f))
+    else:
+        # The original approach: whole response decoded to text, every column inferred
+        text = Path(payload_path).read_bytes().decode()
+        rows = len(pd.read_csv(io.StringIO(text)))
+    conn.send((time.perf_counter() - started, rows, baseline_rss, peak_rss_mb()))
+
+def bench_parse(payload_path, repeat, streaming):
+    context = multiprocessing.get_context('spawn')
+    samples = []
+    for _ in range(repeat):
+        parent_conn, child_conn = context.Pipe()
+        process = context.Process(target=_parse_in_child, args=(payload_path, streaming, child_conn))
+        process.start()
+        elapsed, rows, baseline_rss, peak_rss = parent_conn.recv()
+        process.join()
+        samples.append(elapsed)
+    extra = {'rows': rows}
+    if peak_rss is not None:
+        extra['peak_rss_mb'] = round(peak_rss, 1)
+        extra['rss_growth_mb'] = round(peak_rss - baseline_rss, 1)
+    return summarize(samples, **extra)
+
+def bench_load(data, spec, store_dir, server, repeat, mode):
+    """load_and_process_data from an empty store (cold), a fresh one (warm) or an expired one"""
+    samples = []
+    result = None
+    requests_made = 0
+    for _ in range(repeat):
+        if mode == 'cold':
+            shutil.rmtree(store_dir, ignore_errors=True)
+        max_age = data.STORE_MAX_AGE_SECONDS
+        if mode == 'incremental':
+            data.STORE_MAX_AGE_SECONDS = 0
+        requests_before = server.requests
+        try:
+            started = time.perf_counter()
+            result = data.load_and_process_data(spec)
+            samples.append(time.perf_counter() - started)
+        finally:
+            data.STORE_MAX_AGE_SECONDS = max_age
+        requests_made = server.requests - requests_before
+    return summarize(samples, rows=len(result[0]), requests=requests_made), result
+
+def run_benchmarks(args, fixture, server, work_dir):
+    # Imported here: the data module reads COMEXT_API_BASE and COMEXT_DATA_STORE on import
+    from timber_engine import data
+    from timber_engine.answer import answer_question
+    from timber_engine.cubes import build_cubes
+    from timber_engine.sandbox import SandboxPool, build_query_extras, execute_code, is_execution_error
+    
+    results = {}
+    spec = dataclasses.replace(data.DEFAULT_SPEC, start_period=args.start, end_period=args.end)
+    periods = spec.periods()
+    
+    payload_path = work_dir / 'payload.csv'
+    payload_path.write_bytes(fixture.payload(periods))
+    results['parse'] = bench_parse(payload_path, args.repeat, streaming=True)
+    results['parse_plain_read_csv'] = bench_parse(payload_path, args.repeat, streaming=False)
+    
+    store_dir = Path(os.environ['COMEXT_DATA_STORE'])
+    results['load_cold'], _ = bench_load(data, spec, store_dir, server, args.repeat, 'cold')
+    results['load_warm'], _ = bench_load(data, spec, store_dir, server, args.repeat, 'warm')
+    results['load_incremental'], (df, wide_df, data_version) = bench_load(
+        data, spec, store_dir, server, args.repeat, 'incremental'
+    )
+    
+    samples, _ = timed(lambda: build_cubes(wide_df), args.repeat)
+    results['cubes_build'] = summarize(samples)
+    samples, extras = timed(lambda: build_query_extras(wide_df), args.repeat)
+    results['query_extras_build'] = summarize(samples)
+    
+    codes = [code for _, code in QUESTION_CORPUS]
+    samples, outputs = timed(lambda: [execute_code(code, df, wide_df, extras) for code in codes], args.repeat)
+    results['exec_corpus'] = summarize(
+        samples, queries=len(codes), errors=sum(is_execution_error(output) for output in outputs)
+    )
+    
+    if args.sandbox_workers > 0:
+        pool = SandboxPool(args.sandbox_workers, work_dir / 'snapshots', data.KEY_COLS)
+        try:
+            samples, _ = timed(lambda: pool.publish(df, wide_df, data_version), 1)
+            results['sandbox_publish'] = summarize(samples)
+            samples, outputs = timed(
+                lambda: [pool.run(code, df, wide_df, data_version) for code in codes], args.repeat
+            )
+            results['sandbox_exec_corpus'] = summarize(
+                samples, queries=len(codes), errors=sum(is_execution_error(output) for output in outputs)
+            )
+        finally:
+            pool.close()
+    
+    model = FakeModel(latency_seconds=args.model_latency)
+    execute = lambda code: execute_code(code, df, wide_df, extras)
+    
+    def answer_corpus(single_call):
+        """Answer every corpus question in a fresh chat; returns the token usage of the pass"""
+        usage = {}
+        for question, _ in QUESTION_CORPUS:
+            answer_question(model.start_chat(), question, execute, single_call, lambda text: None, usage)
+        return usage
+    
+    for name, single_call in (('pipeline_two_step', False), ('pipeline_single_call', True)):
+        samples, usage = timed(lambda: answer_corpus(single_call), args.repeat)
+        results[name] = summarize(samples, questions=len(QUESTION_CORPUS), **usage)
+    
+    return results
+
+def git_revision():
+    try:
+        revision = subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision or None
+
+def print_report(report, baseline=None):
+    baseline_results = (baseline or {}).get('results', {})
+    header = f"{'benchmark':<24}{'median ms':>12}{'min ms':>10}{'max ms':>10}"
+    if baseline is not None:
+        header += f"{'baseline ms':>13}{'ratio':>8}"
+    print(header)
+    for name, result in report['results'].items():
+        line = f"{name:<24}{result['median_ms']:>12.1f}{result['min_ms']:>10.1f}{result['max_ms']:>10.1f}"
+        previous = baseline_results.get(name)
+        if previous is not None:
+            line += f"{previous['median_ms']:>13.1f}{result['median_ms'] / previous['median_ms']:>8.2f}"
+        details = {k: v for k, v in result.items() if not k.endswith('_ms') and k != 'runs'}
+        if details:
+            line += '  ' + ', '.join(f"{k}={v}" for k, v in details.items())
+        print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--label', default='run', help="name used in the report file name")
+    parser.add_argument('--partners', type=int, default=9, help="partner countries; above 9 adds synthetic ones")
+    parser.add_argument('--start', default='2024-01', help="first month")
+    parser.add_argument('--months', type=int, default=20, help="number of months from --start")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per benchmark")
+    parser.add_argument('--sandbox-workers', type=int, default=2, help="0 skips the sandbox pool benchmarks")
+    parser.add_argument('--model-latency', type=float, default=0.0, help="seconds added to every fake model call")
+    parser.add_argument('--baseline', type=Path, help="earlier report to compare against")
+    parser.add_argument('--out', type=Path, default=RESULTS_DIR, help="directory for the JSON report")
+    args = parser.parse_args(argv)
+    args.end = (pd.Period(args.start, freq='M') + args.months - 1).strftime('%Y-%m')
+    
+    fixture = CsvdataFixture(args.partners)
+    with tempfile.TemporaryDirectory(prefix='timber-bench-') as tmp, FixtureServer(fixture) as server:
+        work_dir = Path(tmp)
+        os.environ['COMEXT_API_BASE'] = server.base_url
+        os.environ['COMEXT_DATA_STORE'] = str(work_dir / 'store')
+        started = time.time()
+        results = run_benchmarks(args, fixture, server, work_dir)
+    
+    report = {
+        'label': args.label,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)),
+        'revision': git_revision(),
+        'params': {
+            'partners': args.partners, 'start': args.start, 'months': args.months,
+            'rows_per_month': fixture.rows_per_month(), 'repeat': args.repeat,
+            'sandbox_workers': args.sandbox_workers, 'model_latency': args.model_latency,
+        },
+        'environment': {
+            'python': platform.python_version(), 'pandas': pd.__version__,
+            'platform': platform.platform(), 'cpus': os.cpu_count(),
+        },
+        'results': results,
+    }
+    args.out.mkdir(parents=True, exist_ok=True)
+    report_path = args.out / f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(started))}-{args.label}.json"
+    report_path.write_text(json.dumps(report, indent=2))
+    
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    print_report(report, baseline)
+    print(f"\nReport written to {report_path}")
+
+if __name__ == '__main__':
+    main()
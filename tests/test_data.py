@@ -0,0 +1,37 @@
+"""load_and_process_data against the local COMEXT fixture server."""
+import dataclasses
+
+import pytest
+
+from benchmarks.fixtures import CsvdataFixture, FixtureServer
+from timber_engine import data
+from timber_engine.sandbox import execute_code, is_execution_error
+
+@pytest.fixture(scope='module')
+def server():
+    with FixtureServer(CsvdataFixture()) as server:
+        yield server
+
+@pytest.fixture
+def spec(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(data, 'COMEXT_DATAFLOW_URL', server.base_url + '/data')
+    monkeypatch.setattr(data, 'DATA_STORE_DIR', tmp_path)
+    return dataclasses.replace(data.DEFAULT_SPEC, start_period='2024-01', end_period='2025-06')
+
+def test_time_period_compares_as_string(spec):
+    fetched = data.load_and_process_data(spec)
+    stored = data.load_and_process_data(spec)  # fresh store, COMEXT not contacted
+    
+    for df, wide_df, _ in (fetched, stored):
+        later = execute_code("result = df[df['time_period'] >= '2025-01']['time_period'].unique()", df, wide_df)
+        assert not is_execution_error(later)
+        assert sorted(later) == [f"2025-{month:02d}" for month in range(1, 7)]
+        assert execute_code("result = df['time_period'].max()", df, wide_df) == '2025-06'
+
+def test_version_is_stable_for_unchanged_data(spec):
+    cold_version = data.load_and_process_data(spec)[2]
+    revalidated_version = data.load_and_process_data(spec, max_store_age=0)[2]
+    full_reload_version = data.load_and_process_data(spec, incremental=False)[2]
+    
+    assert revalidated_version == cold_version
+    assert full_reload_version == cold_version
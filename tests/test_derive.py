@@ -0,0 +1,125 @@
+"""derive_indicators against the original row-by-row derivation.
+
+The reference below is the CUM_VALUE and UNIT_VALUE code that
+load_and_process_data ran before the derivation was vectorized: the same
+per-row loop over VALUE_IN_EUROS rows, each scanning for the first matching
+CUM_VALUE row, with 0 (and a skipped_count) for a zero or missing volume.
+Only the scan is done on numpy arrays of the row's reporter/partner
+partition instead of boolean-filtering the whole frame, which keeps its
+matches and their order but takes seconds instead of minutes on 100k rows.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from timber_engine.data import KEY_COLS, clean_raw_data, derive_indicators
+
+REPORTERS = [f"R{i:02d}" for i in range(28)]
+PARTNERS = [f"P{i:02d}" for i in range(20)]
+PRODUCTS = ['440711', '440712', '440713', '440714', '440719', '440799']
+MONTHS = [str(period) for period in pd.period_range('2024-01', periods=16, freq='M')]
+
+def synthetic_raw(seed=0):
+    """~100k raw csvdata rows with zero, missing and duplicated quantities"""
+    rng = np.random.default_rng(seed)
+    keys = pd.MultiIndex.from_product(
+        [REPORTERS, PARTNERS, PRODUCTS, MONTHS], names=KEY_COLS
+    ).to_frame(index=False)
+    quantity = keys.assign(indicators='QUANTITY_IN_100KG', obs_value=np.round(rng.gamma(0.6, 900, len(keys)), 1))
+    quantity.loc[rng.random(len(keys)) < 0.05, 'obs_value'] = 0
+    value = keys.assign(indicators='VALUE_IN_EUROS', obs_value=np.round(rng.uniform(0, 50_000, len(keys)), 0))
+    
+    # Keys with a value but no quantity, and keys reported twice
+    quantity = quantity[rng.random(len(keys)) >= 0.03]
+    duplicates = quantity.sample(frac=0.01, random_state=seed).assign(obs_value=lambda d: d['obs_value'] + 1)
+    raw = pd.concat([value, quantity, duplicates], ignore_index=True).sample(frac=1, random_state=seed)
+    raw.columns = raw.columns.str.upper()
+    return raw.reset_index(drop=True)
+
+def reference_derive(df):
+    """Original derivation; returns the extended frame and its skipped_count"""
+    # Product multipliers for CUM_VALUE calculation
+    multipliers = {
+        '440711': 0.1888,
+        '440712': 0.2128,
+        '440713': 0.2,
+        '440714': 0.2,
+        '440719': 0.2
+    }
+    
+    # Add CUM_VALUE rows (cubic meters)
+    quantity_rows = df[df['indicators'] == 'QUANTITY_IN_100KG'].copy()
+    quantity_rows['indicators'] = 'CUM_VALUE'
+    quantity_rows['obs_value'] = quantity_rows.apply(
+        lambda row: row['obs_value'] * multipliers.get(str(row['product']), 0.2),
+        axis=1
+    )
+    
+    # Concatenate to have CUM_VALUE available
+    df = pd.concat([df, quantity_rows], ignore_index=True)
+    
+    # Add UNIT_VALUE rows (price per cubic meter)
+    value_rows = df[df['indicators'] == 'VALUE_IN_EUROS'].copy()
+    partitions = {
+        key: {col: part[col].to_numpy() for col in part.columns}
+        for key, part in df.groupby(['reporter', 'partner'], sort=False)
+    }
+    
+    unit_value_rows = []
+    skipped_count = 0
+    
+    for value_row in value_rows.to_dict('records'):
+        part = partitions[value_row['reporter'], value_row['partner']]
+        # Find corresponding CUM_VALUE
+        cum_values = part['obs_value'][
+            (part['reporter'] == value_row['reporter']) &
+            (part['partner'] == value_row['partner']) &
+            (part['product'] == value_row['product']) &
+            (part['time_period'] == value_row['time_period']) &
+            (part['indicators'] == 'CUM_VALUE')
+        ]
+        
+        new_row = dict(value_row)
+        new_row['indicators'] = 'UNIT_VALUE'
+        
+        if len(cum_values) == 0 or cum_values[0] == 0:
+            # Set to NaN/0 instead of skipping
+            new_row['obs_value'] = 0  # or use float('nan')
+            skipped_count += 1
+        else:
+            new_row['obs_value'] = value_row['obs_value'] / cum_values[0]
+        
+        unit_value_rows.append(new_row)
+    
+    if unit_value_rows:
+        df = pd.concat([df, pd.DataFrame(unit_value_rows, columns=df.columns)], ignore_index=True)
+    
+    return df, skipped_count
+
+def as_plain(df):
+    """String keys and float values, so categorical and object frames compare equal"""
+    df = df.astype({col: str for col in KEY_COLS + ['indicators']})
+    return df.astype({'obs_value': 'float64'}).reset_index(drop=True)
+
+@pytest.fixture(scope='module')
+def cleaned():
+    return clean_raw_data(synthetic_raw(), [])
+
+def test_synthetic_data_size(cleaned):
+    assert len(cleaned) >= 100_000
+
+def test_derive_indicators_matches_reference(cleaned):
+    processing_log = []
+    derived = derive_indicators(cleaned, processing_log)
+    expected, skipped_count = reference_derive(as_plain(cleaned))
+    
+    pd.testing.assert_frame_equal(as_plain(derived)[expected.columns], as_plain(expected))
+    
+    counts = [
+        int(match.group(1)) for line in processing_log
+        if (match := re.match(r'(\d+) UNIT_VALUE rows with zero/missing CUM_VALUE', line))
+    ]
+    assert counts == [skipped_count]
+    assert skipped_count > 0
@@ -0,0 +1,34 @@
+"""Query helpers on a small hand-checked wide table."""
+import pandas as pd
+import pytest
+
+from timber_engine.helpers import make_helpers
+
+@pytest.fixture
+def helpers():
+    months = pd.period_range('2024-01', periods=4, freq='M')
+    index = pd.MultiIndex.from_product(
+        [['PL'], ['CN', 'JP'], ['440711'], months], names=['reporter', 'partner', 'product', 'time_period']
+    )
+    # CN: 10 m³ a month at 100 EUR/m³; JP: 30 m³ a month at 200 EUR/m³
+    volume = [10.0] * 4 + [30.0] * 4
+    value = [1000.0] * 4 + [6000.0] * 4
+    wide_df = pd.DataFrame({
+        'QUANTITY_IN_100KG': [v * 5 for v in volume],
+        'VALUE_IN_EUROS': value,
+        'CUM_VALUE': volume,
+        'UNIT_VALUE': [a / b for a, b in zip(value, volume)],
+    }, index=index)
+    return make_helpers(wide_df)
+
+def test_rolling_sum_adds_up_volumes(helpers):
+    rolling = helpers['rolling_sum']('CUM_VALUE', 3, reporter='PL')
+    assert rolling.isna().tolist() == [True, True, False, False]
+    assert rolling.iloc[-1] == pytest.approx(120.0)
+
+def test_rolling_sum_of_unit_value_is_value_weighted(helpers):
+    rolling = helpers['rolling_sum']('UNIT_VALUE', 3, reporter='PL')
+    assert rolling.isna().tolist() == [True, True, False, False]
+    # (3 * 1000 + 3 * 6000) / (3 * 10 + 3 * 30), not a sum of monthly prices
+    assert rolling.iloc[-1] == pytest.approx(175.0)
+    assert helpers['rolling_sum']('UNIT_VALUE', 2, reporter='PL', partner='JP').iloc[-1] == pytest.approx(200.0)
@@ -0,0 +1,19 @@
+"""UI-free pieces of the EU Timber Export Analyst"""
+
+from timber_engine.answer import answer_question
+from timber_engine.answer_cache import AnswerCache
+from timber_engine.cubes import build_cubes
+from timber_engine.data import DEFAULT_SPEC, DataLoadError, DatasetSpec, load_and_process_data
+from timber_engine.dataset import Dataset, DatasetStore, load_dataset
+from timber_engine.helpers import make_helpers
+from timber_engine.prompt import build_gemini_history, build_system_prompt
+from timber_engine.query import QueryCache, QueryRunner
+from timber_engine.sandbox import SandboxPool, build_query_extras, execute_code, is_execution_error
+from timber_engine.tracing import Trace, TraceLog, trace_span
+
+__all__ = [
+    'AnswerCache', 'DEFAULT_SPEC', 'DataLoadError', 'Dataset', 'DatasetSpec', 'DatasetStore', 'QueryCache',
+    'QueryRunner', 'SandboxPool', 'Trace', 'TraceLog', 'answer_question', 'build_cubes', 'build_gemini_history',
+    'build_query_extras', 'build_system_prompt', 'execute_code', 'is_execution_error', 'load_and_process_data',
+    'load_dataset', 'make_helpers', 'trace_span',
+]
@@ -0,0 +1,140 @@
+"""Question to answer: model calls around the execution of generated code.
+
+The chat object only needs send_message(prompt, stream=False) returning a
+response with .text (or an iterable of chunks with .text when streaming)
+and optionally .usage_metadata, as google.generativeai chats do.
+"""
+import numbers
+import re
+import time
+
+from timber_engine.sandbox import is_execution_error
+from timber_engine.tracing import trace_span
+
+def format_result(execution_result):
+    """Thousands-separated numbers, str() for anything else"""
+    if isinstance(execution_result, (int, float)):
+        if isinstance(execution_result, float):
+            return f"{execution_result:,.2f}"
+        return f"{execution_result:,}"
+    return str(execution_result)
+
+# Question answering pipeline. In two-step mode the model writes code, the
+# code runs, and a second call interprets the result. In single-call mode the
+# model also returns a narrative template with a {result} placeholder that is
+# filled locally; the second call is only made when the result is not a
+# scalar or the template does not fit
+RESULT_PLACEHOLDER = '{result}'
+
+def is_scalar_result(result):
+    return isinstance(result, numbers.Number) and not isinstance(result, bool)
+
+def fill_narrative_template(template, formatted_result):
+    """Template with the result filled in, or None if it has no usable placeholder"""
+    if not template or RESULT_PLACEHOLDER not in template:
+        return None
+    filled = template.replace(RESULT_PLACEHOLDER, formatted_result)
+    if re.search(r'\{\w+\}', filled):
+        return None
+    return filled
+
+def record_usage(response, *usages):
+    """Add a response's prompt and output token counts to each usage dict given"""
+    metadata = getattr(response, 'usage_metadata', None)
+    if metadata is None:
+        return
+    for usage in usages:
+        if usage is None:
+            continue
+        usage['prompt_tokens'] = usage.get('prompt_tokens', 0) + (metadata.prompt_token_count or 0)
+        usage['output_tokens'] = usage.get('output_tokens', 0) + (metadata.candidates_token_count or 0)
+
+def send_message(chat, prompt, usage=None, span=None):
+    response = chat.send_message(prompt)
+    record_usage(response, usage, span)
+    return response.text
+
+def send_streaming(chat, prompt, on_text=None, usage=None, span=None):
+    """send_message that streams and reports the growing text to on_text"""
+    if on_text is None:
+        return send_message(chat, prompt, usage, span)
+    started = time.perf_counter()
+    text = ''
+    response = chat.send_message(prompt, stream=True)
+    for chunk in response:
+        if not text and span is not None:
+            span['first_token'] = time.perf_counter() - started
+        text += chunk.text
+        on_text(text)
+    record_usage(response, usage, span)
+    return text
+
+def answer_question(chat, question, execute, single_call=False, on_text=None, usage=None, trace=None):
+    """Answer one question in an open chat whose model carries the system prompt.
+    
+    execute(code) runs generated code against the data and returns its
+    result or an execute_code-style error message. The narrative
+    (interpretation or direct answer) is streamed to on_text as it is
+    generated, token counts are added to usage, and each model call and
+    the code execution are recorded as spans on trace. Returns
+    (answer, cacheable): answer holds the narrative and, when code was
+    generated, the code and formatted result; cacheable is False when the
+    code failed.
+    """
+    # Step 1: Get code from AI
+    if single_call:
+        code_prompt = f"""User question: {question}
+
+Reply with exactly two fenced blocks and nothing else:
+1. A ```python block with the code. Assign the final result to a variable called 'result'.
+2. A ```narrative block with the concise, professional answer written as a template, using the literal placeholder {RESULT_PLACEHOLDER} wherever the computed number goes. Do NOT write any other numbers derived from the data.
+"""
+    else:
+        code_prompt = f"""User question: {question}
+
+Generate ONLY the Python code to answer this question. Do not include explanations yet.
+Assign the final result to a variable called 'result'.
+"""
+    with trace_span(trace, 'codegen') as span:
+        code_response = send_message(chat, code_prompt, usage, span)
+    
+    # Step 2: Extract and execute code
+    code_blocks = re.findall(r'```python\n(.*?)\n```', code_response, re.DOTALL)
+    
+    if not code_blocks:
+        # No code generated - direct response
+        with trace_span(trace, 'direct_answer') as span:
+            narrative = send_streaming(chat, f"User question: {question}", on_text, usage, span)
+        return {'narrative': narrative}, True
+    
+    code = code_blocks[0]
+    with trace_span(trace, 'exec') as span:
+        execution_result = execute(code)
+        span['failed'] = is_execution_error(execution_result)
+    formatted_result = format_result(execution_result)
+    
+    narrative = None
+    if single_call and is_scalar_result(execution_result):
+        templates = re.findall(r'```narrative\n(.*?)\n```', code_response, re.DOTALL)
+        narrative = fill_narrative_template(templates[0] if templates else None, formatted_result)
+    
+    if narrative is None:
+        # Step 3: Ask AI to formulate response using ACTUAL result
+        interpretation_prompt = f"""The code executed successfully and returned this result: {execution_result}
+
+User's question was: {question}
+
+Now provide a clear, natural language answer using this EXACT result. Include:
+1. A direct answer to the question
+2. The actual number from the result: {execution_result}
+3. Appropriate units and context. Be precise, but narrative: remember you're a top-notch analyst with excellent editorial skills and well-developed logic. Your user is likely well-familiar with timber market and wants data-driven insights.
+4. Do NOT make up any numbers - use only the result provided: {execution_result}
+
+Keep it concise and professional."""
+        with trace_span(trace, 'interpretation') as span:
+            narrative = send_streaming(chat, interpretation_prompt, on_text, usage, span)
+    elif on_text is not None:
+        on_text(narrative)
+    
+    answer = {'code': code, 'result': formatted_result, 'narrative': narrative}
+    return answer, not is_execution_error(execution_result)
@@ -0,0 +1,91 @@
+"""Persistent cache of finished answers.
+
+Answers (code, formatted result and narrative) are kept in SQLite, keyed
+on the normalized question, the conversation before it and the data
+version. A repeated question skips both model calls, while a follow-up
+("and in 2025?") only matches an answer given after the same earlier
+turns. Entries expire after ttl_seconds, and beyond max_entries the least
+recently used ones are dropped.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+
+from timber_engine.data import DATA_STORE_DIR
+
+ANSWER_CACHE_PATH = DATA_STORE_DIR / 'answers.sqlite'
+ANSWER_CACHE_TTL_SECONDS = int(os.environ.get('ANSWER_CACHE_TTL', 7 * 24 * 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', 500))
+
+def normalize_question(question):
+    """Lowercase and drop punctuation and extra whitespace"""
+    return ' '.join(re.sub(r'[^\w\s]', ' ', question.lower()).split())
+
+def conversation_key(history):
+    """Digest of the chat history a question is asked in; '' for a new conversation"""
+    if not history:
+        return ''
+    return hashlib.sha256(json.dumps(history, sort_keys=True).encode()).hexdigest()[:16]
+
+def cache_key(question, context=''):
+    normalized = normalize_question(question)
+    return f"{context}:{normalized}" if context else normalized
+
+class AnswerCache:
+    """Answer dicts by (question, conversation, data version) in one SQLite file.
+    
+    The conversation is a conversation_key digest, '' for a question asked
+    first. Safe to share across threads and processes.
+    """
+    
+    def __init__(self, path=ANSWER_CACHE_PATH, ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+    
+    def _connect(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "question TEXT, data_version TEXT, answer TEXT, created_at REAL, last_used REAL, "
+            "PRIMARY KEY (question, data_version))"
+        )
+        return conn
+    
+    def get(self, question, data_version, context=''):
+        """Stored answer dict for the question in this conversation and data version, or None"""
+        key = cache_key(question, context)
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT answer FROM answers WHERE question = ? AND data_version = ? AND created_at > ?",
+                (key, data_version, time.time() - self.ttl_seconds)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE answers SET last_used = ? WHERE question = ? AND data_version = ?",
+                (time.time(), key, data_version)
+            )
+        return json.loads(row[0])
+    
+    def put(self, question, data_version, answer, context=''):
+        """Save an answer, dropping expired entries and the least recently used beyond the size limit"""
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?)",
+                (cache_key(question, context), data_version, json.dumps(answer), now, now)
+            )
+            conn.execute("DELETE FROM answers WHERE created_at <= ?", (now - self.ttl_seconds,))
+            conn.execute(
+                "DELETE FROM answers WHERE rowid NOT IN "
+                "(SELECT rowid FROM answers ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,)
+            )
@@ -0,0 +1,272 @@
+"""Answer a file of questions without the UI, e.g. for the monthly market report.
+
+    python -m timber_engine.batch questions.txt --out report.csv --out report.jsonl
+
+The questions file has one question per line; blank lines and lines starting
+with # are skipped. The data is loaded once and every question is answered
+in a fresh chat against that version. Questions run concurrently, but at
+most --max-in-flight model requests are open at a time; rate limits and
+transient server errors are retried with exponential backoff, and a rate
+limit pauses every request until the backoff has passed. Rows (code,
+formatted result, narrative, per-stage seconds, tokens) are written as each
+question finishes, to CSV or JSON lines depending on the file extension.
+
+The Gemini key is read from GEMINI_API_KEY or .streamlit/secrets.toml.
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from timber_engine.answer import answer_question
+from timber_engine.data import DATA_STORE_DIR, DEFAULT_SPEC, KEY_COLS
+from timber_engine.dataset import load_dataset
+from timber_engine.prompt import GEMINI_MODEL, build_system_prompt
+from timber_engine.query import (
+    QUERY_CACHE_SIZE, SANDBOX_MEMORY_LIMIT_MB, SANDBOX_TIMEOUT_SECONDS, SANDBOX_WORKERS, QueryCache, QueryRunner,
+)
+from timber_engine.sandbox import SandboxPool
+from timber_engine.tracing import Trace, TraceLog
+
+SECRETS_PATH = Path('.streamlit') / 'secrets.toml'
+
+# HTTP statuses of google.api_core errors worth retrying: rate limit and transient server errors
+RETRYABLE_STATUS = {429, 500, 503, 504}
+
+FIELDS = [
+    'index', 'question', 'status', 'code', 'result', 'narrative', 'error', 'total_s',
+    'codegen_s', 'exec_s', 'interpretation_s', 'direct_answer_s', 'prompt_tokens', 'output_tokens', 'retries',
+]
+STAGES = ('codegen', 'exec', 'interpretation', 'direct_answer')
+
+def is_retryable(error):
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return getattr(error, 'code', None) in RETRYABLE_STATUS
+
+def is_rate_limit(error):
+    return getattr(error, 'code', None) == 429
+
+class ModelLimiter:
+    """Bounds concurrent model requests and retries failed ones with exponential backoff.
+    
+    The delay doubles per attempt from base_delay up to max_delay, with
+    jitter. A rate limit error also holds back every other request until
+    its delay has passed, so the workers do not keep hitting the quota.
+    """
+    
+    def __init__(self, max_in_flight, max_retries=5, base_delay=2.0, max_delay=60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._semaphore = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+    
+    def _wait_for_resume(self):
+        while True:
+            with self._lock:
+                wait = self._resume_at - time.monotonic()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+    
+    def call(self, fn, *args, stats=None, **kwargs):
+        """fn(*args, **kwargs) within the limits; retries are counted in stats['retries']"""
+        attempt = 0
+        while True:
+            self._wait_for_resume()
+            with self._semaphore:
+                try:
+                    return fn(*args, **kwargs)
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        raise
+                    error = e
+            delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            if is_rate_limit(error):
+                with self._lock:
+                    self._resume_at = max(self._resume_at, time.monotonic() + delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+            if stats is not None:
+                stats['retries'] = stats.get('retries', 0) + 1
+
+class LimitedChat:
+    """Chat whose send_message goes through a ModelLimiter"""
+    
+    def __init__(self, chat, limiter, stats=None):
+        self.chat = chat
+        self.limiter = limiter
+        self.stats = stats
+    
+    def send_message(self, prompt, stream=False):
+        return self.limiter.call(self.chat.send_message, prompt, stream=stream, stats=self.stats)
+
+def read_questions(path):
+    """Questions from a file, or stdin for '-'"""
+    text = sys.stdin.read() if str(path) == '-' else Path(path).read_text(encoding='utf-8')
+    lines = (line.strip() for line in text.splitlines())
+    return [line for line in lines if line and not line.startswith('#')]
+
+def answer_row(index, question, model, limiter, query_runner, dataset, single_call=False):
+    """Answer one question in a fresh chat; returns the output row and the turn trace"""
+    trace = Trace('batch', question=question, data_version=dataset.version)
+    usage = {}
+    stats = {'retries': 0}
+    row = {'index': index, 'question': question, 'code': '', 'result': '', 'narrative': '', 'error': ''}
+    try:
+        answer, cacheable = answer_question(
+            LimitedChat(model.start_chat(), limiter, stats), question,
+            lambda code: query_runner.run(code, dataset.df, dataset.wide_df, dataset.version),
+            single_call=single_call,
+            usage=usage,
+            trace=trace,
+        )
+        row.update(answer)
+        row['status'] = 'ok' if cacheable else 'code_error'
+    except Exception as e:
+        row['status'] = 'error'
+        row['error'] = str(e)
+        trace.attrs['error'] = str(e)
+    trace.finish()
+    
+    row['total_s'] = round(trace.duration, 3)
+    for stage in STAGES:
+        seconds = sum(span['duration'] for span in trace.spans if span['name'] == stage)
+        row[f'{stage}_s'] = round(seconds, 3) if seconds else ''
+    row['prompt_tokens'] = usage.get('prompt_tokens', 0)
+    row['output_tokens'] = usage.get('output_tokens', 0)
+    row['retries'] = stats['retries']
+    trace.attrs.update(usage, retries=stats['retries'])
+    return row, trace
+
+class ResultWriter:
+    """Rows appended to a .csv file, or a JSON lines file for .jsonl/.json"""
+    
+    def __init__(self, path):
+        self.path = Path(path)
+        self.jsonl = self.path.suffix.lower() in ('.jsonl', '.json')
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'w', encoding='utf-8', newline='')
+        if not self.jsonl:
+            self._csv = csv.DictWriter(self._file, fieldnames=FIELDS)
+            self._csv.writeheader()
+    
+    def write(self, row):
+        if self.jsonl:
+            self._file.write(json.dumps({field: row.get(field) for field in FIELDS}, default=str) + '\n')
+        else:
+            self._csv.writerow({field: row.get(field, '') for field in FIELDS})
+        self._file.flush()
+    
+    def close(self):
+        self._file.close()
+
+def run_batch(questions, model, dataset, query_runner, limiter, workers=8, single_call=False, on_row=None):
+    """Answer all questions concurrently; on_row(row, trace) is called as each finishes.
+    
+    Returns the rows in question order.
+    """
+    rows = [None] * len(questions)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(answer_row, index, question, model, limiter, query_runner, dataset, single_call)
+            for index, question in enumerate(questions)
+        ]
+        for future in as_completed(futures):
+            row, trace = future.result()
+            rows[row['index']] = row
+            if on_row is not None:
+                on_row(row, trace)
+    return rows
+
+def gemini_api_key():
+    api_key = os.environ.get('GEMINI_API_KEY', '')
+    if not api_key and SECRETS_PATH.exists():
+        import tomllib
+        
+        with open(SECRETS_PATH, 'rb') as f:
+            api_key = tomllib.load(f).get('GEMINI_API_KEY', '')
+    return api_key
+
+def init_gemini(system_prompt):
+    """Gemini model with the system prompt as its system instruction, as in the app"""
+    import google.generativeai as genai
+    
+    api_key = gemini_api_key()
+    if not api_key:
+        raise SystemExit("GEMINI_API_KEY is not set (environment or .streamlit/secrets.toml)")
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(GEMINI_MODEL, system_instruction=system_prompt)
+
+def main(argv=None, model=None):
+    """Command-line entry point; model replaces Gemini when given (anything with start_chat())"""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('questions', help="file with one question per line, or - for stdin")
+    parser.add_argument('--out', type=Path, action='append', required=True,
+                        help=".csv or .jsonl file for the results; may be given more than once")
+    parser.add_argument('--workers', type=int, default=8, help="questions answered at the same time")
+    parser.add_argument('--max-in-flight', type=int, default=4, help="open model requests at most")
+    parser.add_argument('--max-retries', type=int, default=5, help="retries per model request")
+    parser.add_argument('--single-call', action='store_true', help="one model call per scalar answer")
+    parser.add_argument('--sandbox-workers', type=int, default=SANDBOX_WORKERS,
+                        help="0 runs generated code in-process")
+    parser.add_argument('--trace-log', type=Path, help="JSON lines file for the load and per-question traces")
+    args = parser.parse_args(argv)
+    
+    questions = read_questions(args.questions)
+    trace_log = TraceLog(args.trace_log) if args.trace_log else None
+    sandbox_pool = None
+    if args.sandbox_workers > 0:
+        sandbox_pool = SandboxPool(
+            args.sandbox_workers, DATA_STORE_DIR / 'snapshots', KEY_COLS,
+            timeout_seconds=SANDBOX_TIMEOUT_SECONDS, memory_limit_mb=SANDBOX_MEMORY_LIMIT_MB
+        )
+    query_runner = QueryRunner(QueryCache(QUERY_CACHE_SIZE), sandbox_pool)
+    try:
+        dataset = load_dataset(DEFAULT_SPEC, query_runner, trace_log)
+        print(f"Loaded {len(dataset.df):,} rows (version {dataset.version}) in {dataset.trace.duration:.1f}s; "
+              f"answering {len(questions)} questions", file=sys.stderr)
+        if model is None:
+            model = init_gemini(build_system_prompt(dataset.df))
+        
+        writers = [ResultWriter(path) for path in args.out]
+        done = []
+        
+        def on_row(row, trace):
+            done.append(row)
+            for writer in writers:
+                writer.write(row)
+            if trace_log is not None:
+                trace_log.write(trace)
+            print(f"[{len(done)}/{len(questions)}] {row['status']} {row['total_s']:.1f}s  {row['question']}",
+                  file=sys.stderr)
+        
+        started = time.perf_counter()
+        try:
+            rows = run_batch(
+                questions, model, dataset, query_runner,
+                ModelLimiter(args.max_in_flight, args.max_retries), args.workers, args.single_call, on_row
+            )
+        finally:
+            for writer in writers:
+                writer.close()
+    finally:
+        if sandbox_pool is not None:
+            sandbox_pool.close()
+    
+    failed = sum(row['status'] != 'ok' for row in rows)
+    print(f"Answered {len(rows)} questions in {time.perf_counter() - started:.1f}s, {failed} failed",
+          file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
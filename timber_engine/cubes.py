@@ -0,0 +1,47 @@
+"""Precomputed rollups of the wide table.
+
+build_cubes returns a dict keyed by (grain, dims): grain is 'year',
+'quarter' or 'ytd' and dims is any subset of ('reporter', 'partner',
+'product') in that order, including (). Each cube is indexed by the dims
+plus the period and holds summed QUANTITY_IN_100KG, VALUE_IN_EUROS and
+CUM_VALUE, with UNIT_VALUE as the value-weighted price VALUE / CUM_VALUE.
+"""
+from itertools import combinations
+
+import pandas as pd
+
+CUBE_DIMS = ('reporter', 'partner', 'product')
+CUBE_GRAINS = ('year', 'quarter', 'ytd')
+SUM_COLS = ['QUANTITY_IN_100KG', 'VALUE_IN_EUROS', 'CUM_VALUE']
+
+def ytd_month(wide_df):
+    """Last month of the latest year in the data; YTD covers January up to it in every year"""
+    periods = wide_df.index.get_level_values('time_period')
+    latest = periods.max()
+    return latest.month
+
+def build_cubes(wide_df):
+    """All (grain, dims) rollups of a wide table indexed by reporter/partner/product/time_period"""
+    flat = wide_df[SUM_COLS].reset_index()
+    periods = pd.PeriodIndex(flat['time_period'])
+    flat['year'] = periods.year
+    flat['quarter'] = periods.asfreq('Q')
+    
+    last_month = ytd_month(wide_df)
+    in_ytd = periods.month <= last_month
+    sources = {
+        'year': (flat, 'year'),
+        'quarter': (flat, 'quarter'),
+        'ytd': (flat[in_ytd], 'year'),
+    }
+    
+    cubes = {}
+    for grain in CUBE_GRAINS:
+        source, period_col = sources[grain]
+        for size in range(len(CUBE_DIMS) + 1):
+            for dims in combinations(CUBE_DIMS, size):
+                cube = source.groupby(list(dims) + [period_col], observed=True)[SUM_COLS].sum()
+                volume = cube['CUM_VALUE'].where(cube['CUM_VALUE'] > 0)
+                cube['UNIT_VALUE'] = cube['VALUE_IN_EUROS'] / volume
+                cubes[grain, dims] = cube
+    return cubes
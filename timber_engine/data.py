@@ -0,0 +1,528 @@
+"""COMEXT download, local store, cleaning and derived indicators.
+
+load_and_process_data returns the long table, its wide indexed form and a
+content hash for one DatasetSpec. Months already in the local Arrow store
+are reused and only missing or recently revised months are downloaded,
+in concurrent chunks parsed straight off the socket.
+"""
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from timber_engine.tracing import trace_span
+
+KEY_COLS = ['reporter', 'partner', 'product', 'time_period']
+# Columns of the long table held as categoricals; time_period stays a plain
+# 'YYYY-MM' string so generated code can compare and sort it as before
+CATEGORY_COLS = ['reporter', 'partner', 'product', 'indicators']
+INDICATOR_COLS = ['QUANTITY_IN_100KG', 'VALUE_IN_EUROS', 'CUM_VALUE', 'UNIT_VALUE']
+
+def build_wide_table(df):
+    """Pivot the long table into one typed row per (reporter, partner, product, month)"""
+    wide = df.pivot_table(index=KEY_COLS, columns='indicators', values='obs_value', aggfunc='first', observed=True)
+    wide = wide.reindex(columns=INDICATOR_COLS).astype('float64')
+    wide.columns.name = None
+    wide = wide.reset_index()
+    
+    # Categorical keys and a monthly period so lookups avoid string compares
+    for col in ['reporter', 'partner', 'product']:
+        wide[col] = wide[col].astype('category')
+    wide['time_period'] = pd.to_datetime(wide['time_period'].astype(str), format='%Y-%m').dt.to_period('M')
+    
+    return wide.set_index(KEY_COLS).sort_index()
+
+# COMEXT SDMX endpoint; the API base can be pointed at a local stub server
+# through COMEXT_API_BASE
+COMEXT_API_BASE = os.environ.get('COMEXT_API_BASE', 'https://ec.europa.eu/eurostat/api/comext/dissemination')
+COMEXT_DATAFLOW_URL = COMEXT_API_BASE + "/sdmx/3.0/data/dataflow/ESTAT/ds-045409/1.0/*.*.*.*.*.*"
+
+@dataclass(frozen=True)
+class DatasetSpec:
+    """One COMEXT slice: the SDMX filters plus a monthly period range.
+    
+    end_period=None means "latest available": up to the previous calendar
+    month, so the range grows on its own and unpublished months simply come
+    back empty until COMEXT releases them.
+    """
+    reporters: tuple
+    partners: tuple
+    products: tuple
+    flows: tuple = ('2',)
+    indicators: tuple = ('QUANTITY_IN_100KG', 'VALUE_IN_EUROS')
+    start_period: str = '2024-01'
+    end_period: str = None
+    
+    def periods(self):
+        """Months covered by the spec as 'YYYY-MM' strings"""
+        end = self.end_period or (pd.Timestamp.today().to_period('M') - 1)
+        return pd.period_range(self.start_period, end, freq='M').strftime('%Y-%m').tolist()
+    
+    def url(self, periods):
+        """SDMX csvdata query for the given months"""
+        filters = {
+            'freq': ['M'],
+            'reporter': self.reporters,
+            'partner': self.partners,
+            'product': self.products,
+            'flow': self.flows,
+            'indicators': self.indicators,
+            'TIME_PERIOD': periods,
+        }
+        query = '&'.join(f"c[{dim}]={','.join(values)}" for dim, values in filters.items())
+        return f"{COMEXT_DATAFLOW_URL}?{query}&compress=false&format=csvdata&formatVersion=2.0"
+    
+    @property
+    def cache_key(self):
+        """Stable key for the scope; independent of how far 'latest' has moved"""
+        scope = self.url([f"{self.start_period}:{self.end_period or 'latest'}"])
+        return hashlib.sha256(scope.encode()).hexdigest()[:16]
+
+DEFAULT_SPEC = DatasetSpec(
+    reporters=('AT', 'BE', 'BG', 'CY', 'CZ', 'DE', 'DK', 'EE', 'ES', 'FI', 'FR', 'GB', 'GR', 'HR',
+               'HU', 'IE', 'IT', 'LT', 'LU', 'LV', 'MT', 'NL', 'PL', 'PT', 'RO', 'SE', 'SI', 'SK'),
+    partners=('CN', 'EG', 'SA', 'AE', 'MA', 'DZ', 'JP', 'KR', 'IN'),
+    products=('440711', '440712', '440713', '440714', '440719'),
+)
+
+# Local store of already-fetched months: an uncompressed Arrow (Feather) file
+# that is memory-mapped on load, plus JSON metadata with the source validators.
+# Incremental loads re-request only missing months plus the most recent
+# REVISION_WINDOW_MONTHS stored ones; a store younger than
+# STORE_MAX_AGE_SECONDS is used without contacting COMEXT at all
+DATA_STORE_DIR = Path(os.environ.get('COMEXT_DATA_STORE', 'data_store'))
+REVISION_WINDOW_MONTHS = int(os.environ.get('COMEXT_REVISION_MONTHS', 3))
+STORE_MAX_AGE_SECONDS = int(os.environ.get('COMEXT_STORE_MAX_AGE', 3600))
+
+def data_store_paths(spec):
+    """Arrow and metadata paths for a dataset scope, keyed by its cache key"""
+    base = DATA_STORE_DIR / f"comext_{spec.cache_key}"
+    return base.with_suffix('.arrow'), base.with_suffix('.json')
+
+def load_data_store(spec):
+    """Memory-map the stored long table, returning (df, metadata) or (None, {}).
+    
+    A missing or unreadable store counts as empty, so the load falls back to
+    a full fetch.
+    """
+    arrow_path, meta_path = data_store_paths(spec)
+    if not (arrow_path.exists() and meta_path.exists()):
+        return None, {}
+    try:
+        store_meta = json.loads(meta_path.read_text())
+        df = feather.read_table(arrow_path, memory_map=True).to_pandas()
+    except (OSError, ValueError):
+        return None, {}
+    # Stores written before time_period was kept as a string hold it as a categorical
+    return df.astype({'time_period': 'str'}), store_meta
+
+def replace_file(path, write):
+    """Have write(tmp_path) fill a uniquely named file next to path, then rename it over path.
+    
+    Processes sharing the store never write the same temporary file, and
+    readers see either the old or the new file, never a partial one.
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix='.tmp')
+    os.close(fd)
+    tmp_path = Path(tmp_name)
+    try:
+        write(tmp_path)
+        tmp_path.replace(path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+def save_data_store(spec, df, store_meta):
+    """Atomically replace the stored long table and its metadata"""
+    arrow_path, meta_path = data_store_paths(spec)
+    arrow_path.parent.mkdir(parents=True, exist_ok=True)
+    replace_file(
+        arrow_path,
+        lambda tmp_path: feather.write_feather(df.reset_index(drop=True), tmp_path, compression='uncompressed')
+    )
+    meta_text = json.dumps({**store_meta, 'saved_at': time.time()})
+    replace_file(meta_path, lambda tmp_path: tmp_path.write_text(meta_text))
+
+def select_fetch_periods(stored_df, periods):
+    """Months to request: everything without a store, else missing plus recently revised months"""
+    if stored_df is None:
+        return list(periods)
+    stored_periods = set(stored_df['time_period'])
+    missing = {p for p in periods if p not in stored_periods}
+    present = [p for p in periods if p in stored_periods]
+    revised = set(present[-REVISION_WINDOW_MONTHS:]) if REVISION_WINDOW_MONTHS > 0 else set()
+    return [p for p in periods if p in missing | revised]
+
+# Downloads are split into chunks of FETCH_CHUNK_MONTHS months and fetched
+# concurrently over a pooled session that retries with exponential backoff
+FETCH_CHUNK_MONTHS = int(os.environ.get('COMEXT_CHUNK_MONTHS', 4))
+FETCH_WORKERS = int(os.environ.get('COMEXT_FETCH_WORKERS', 4))
+FETCH_TIMEOUT_SECONDS = 30
+
+_http_session = None
+
+def get_http_session():
+    """Shared requests session with connection pooling and retries"""
+    global _http_session
+    if _http_session is None:
+        retry = Retry(
+            total=3,
+            backoff_factor=1,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=['GET'],
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_maxsize=FETCH_WORKERS)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _http_session = session
+    return _http_session
+
+class HashingReader(io.RawIOBase):
+    """Readable byte stream that feeds everything read through sha256"""
+    
+    def __init__(self, raw):
+        self._raw = raw
+        self.sha256 = hashlib.sha256()
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        data = self._raw.read(len(buffer))
+        self.sha256.update(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+# csvdata columns kept at parse time; the API varies their case, so dtypes are
+# given for both spellings. obs_value is left to inference so stray
+# non-numeric markers are coerced in clean_raw_data instead of failing the parse
+CSV_COLUMNS = ['reporter', 'partner', 'product', 'indicators', 'time_period', 'obs_value']
+CSV_DTYPES = {
+    name: 'category' if col in CATEGORY_COLS else 'str'
+    for col in ['reporter', 'partner', 'product', 'indicators', 'time_period']
+    for name in (col, col.upper())
+}
+
+def parse_csvdata(stream):
+    """Parse a csvdata byte stream, reading only the needed columns with CSV_DTYPES"""
+    return pd.read_csv(stream, usecols=lambda col: col.lower() in CSV_COLUMNS, dtype=CSV_DTYPES)
+
+def fetch_chunk(spec, periods, previous_fetch=None, trace=None):
+    """Download the COMEXT csvdata slice for one chunk of months.
+    
+    Returns (raw_df, fetch_meta). raw_df is None when COMEXT has nothing new
+    for these months: 404, 304 Not Modified, or a byte-identical payload.
+    """
+    url = spec.url(periods)
+    
+    # Validators only apply to a repeat of the same request
+    if not previous_fetch or previous_fetch.get('url') != url:
+        previous_fetch = {}
+    headers = {}
+    if previous_fetch.get('etag'):
+        headers['If-None-Match'] = previous_fetch['etag']
+    if previous_fetch.get('last_modified'):
+        headers['If-Modified-Since'] = previous_fetch['last_modified']
+    
+    with get_http_session().get(url, headers=headers, timeout=FETCH_TIMEOUT_SECONDS, stream=True) as response:
+        if response.status_code in (304, 404):
+            # COMEXT answers 404 when none of the requested months are published yet
+            return None, previous_fetch
+        response.raise_for_status()
+        
+        # Parse straight off the socket, hashing the bytes as they are consumed
+        response.raw.decode_content = True
+        stream = HashingReader(response.raw)
+        # Streamed, so this span includes the download
+        with trace_span(trace, 'parse', months=f"{periods[0]}..{periods[-1]}") as span:
+            raw_df = parse_csvdata(io.BufferedReader(stream))
+            span['rows'] = len(raw_df)
+        
+        fetch_meta = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'content_hash': stream.sha256.hexdigest(),
+        }
+    if fetch_meta['content_hash'] == previous_fetch.get('content_hash'):
+        return None, fetch_meta
+    return raw_df, fetch_meta
+
+def fetch_raw_data(spec, periods, previous_fetches, processing_log, trace=None):
+    """Fetch the given months in concurrent chunks and reassemble them.
+    
+    previous_fetches maps chunk URL to its last fetch metadata. Returns
+    (raw_df, fetch_metas); raw_df holds only the chunks that changed and is
+    None when none did.
+    """
+    chunks = [periods[i:i + FETCH_CHUNK_MONTHS] for i in range(0, len(periods), FETCH_CHUNK_MONTHS)]
+    
+    def timed_fetch(chunk):
+        started = time.perf_counter()
+        raw_df, fetch_meta = fetch_chunk(spec, chunk, previous_fetches.get(spec.url(chunk)), trace)
+        return chunk, raw_df, fetch_meta, time.perf_counter() - started
+    
+    with trace_span(trace, 'fetch', months=len(periods), chunks=len(chunks)):
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            results = list(executor.map(timed_fetch, chunks))
+    
+    raw_frames = []
+    fetch_metas = {}
+    for chunk, raw_df, fetch_meta, elapsed in results:
+        status = "unchanged" if raw_df is None else f"{len(raw_df)} rows"
+        processing_log.append(f"Chunk {chunk[0]}..{chunk[-1]}: {status} in {elapsed:.2f}s")
+        if fetch_meta:
+            fetch_metas[fetch_meta['url']] = fetch_meta
+        if raw_df is not None:
+            raw_frames.append(raw_df)
+    
+    if not raw_frames:
+        return None, fetch_metas
+    return pd.concat(raw_frames, ignore_index=True), fetch_metas
+
+def normalize_key(series, upper=False):
+    """Strip (and optionally uppercase) a key column as a categorical"""
+    series = series.astype('category')
+    categories = series.cat.categories
+    cleaned = categories.astype(str).str.strip()
+    if upper:
+        cleaned = cleaned.str.upper()
+    return series.map(dict(zip(categories, cleaned))).astype('category')
+
+def clean_raw_data(df, processing_log):
+    """Keep the needed columns and normalize keys and values"""
+    # Make column names case-insensitive (lowercase)
+    df.columns = df.columns.str.lower()
+    
+    available_cols = [col for col in CSV_COLUMNS if col in df.columns]
+    processing_log.append(f"Available columns: {available_cols}")
+    df = df[available_cols]
+    
+    # Clean and standardize data; keys are rewritten per category, not per row
+    df['reporter'] = normalize_key(df['reporter'], upper=True)
+    df['partner'] = normalize_key(df['partner'], upper=True)
+    df['product'] = normalize_key(df['product'])
+    df['indicators'] = normalize_key(df['indicators'], upper=True)
+    df['time_period'] = df['time_period'].astype('str').str.strip()
+    df['obs_value'] = pd.to_numeric(df['obs_value'], errors='coerce').fillna(0)
+    
+    # Remove any rows with missing critical data
+    before_dropna = len(df)
+    df = df.dropna(subset=['reporter', 'partner', 'product', 'indicators', 'time_period'])
+    after_dropna = len(df)
+    processing_log.append(f"Dropped {before_dropna - after_dropna} rows with missing data")
+    processing_log.append(f"After cleaning: {len(df)} rows")
+    
+    return df
+
+@dataclass(frozen=True)
+class ConversionFactor:
+    """A conversion factor for one product, optionally narrowed to a reporter or period range"""
+    product: str
+    factor: float
+    reporter: str = None
+    start_period: str = None
+    end_period: str = None
+
+    @property
+    def specificity(self):
+        return sum(value is not None for value in (self.reporter, self.start_period, self.end_period))
+
+@dataclass(frozen=True)
+class ConversionTable:
+    """Per-product conversion factors with a fallback for unlisted products"""
+    factors: tuple = ()
+    default: float = 1.0
+
+    def lookup(self, rows):
+        """Factor for each row, applied per category with narrower entries overriding broader ones"""
+        product_factors = {f.product: f.factor for f in self.factors if f.specificity == 0}
+        result = (
+            rows['product'].astype(str).map(product_factors)
+            .astype('float64').fillna(self.default).to_numpy(copy=True)
+        )
+        overrides = sorted((f for f in self.factors if f.specificity), key=lambda f: f.specificity)
+        if overrides:
+            periods = rows['time_period'].astype(str)
+            for f in overrides:
+                mask = rows['product'] == f.product
+                if f.reporter is not None:
+                    mask &= rows['reporter'] == f.reporter
+                if f.start_period is not None:
+                    mask &= periods >= f.start_period
+                if f.end_period is not None:
+                    mask &= periods <= f.end_period
+                result[mask.to_numpy()] = f.factor
+        return result
+
+# Cubic meters per 100 kg
+VOLUME_FACTORS = ConversionTable(
+    factors=(
+        ConversionFactor('440711', 0.1888),
+        ConversionFactor('440712', 0.2128),
+        ConversionFactor('440713', 0.2),
+        ConversionFactor('440714', 0.2),
+        ConversionFactor('440719', 0.2),
+    ),
+    default=0.2,
+)
+
+@dataclass(frozen=True)
+class DerivedIndicator:
+    """An indicator computed from others: source * conversion, or source / denominator"""
+    name: str
+    source: str
+    conversion: ConversionTable = None
+    denominator: str = None
+
+# Derived in order, so later entries may use earlier ones. Add the name to
+# INDICATOR_COLS to carry a new indicator into wide_df, e.g.
+# DerivedIndicator('TONNES', 'QUANTITY_IN_100KG', ConversionTable(default=0.1))
+DERIVED_INDICATORS = (
+    DerivedIndicator('CUM_VALUE', 'QUANTITY_IN_100KG', conversion=VOLUME_FACTORS),
+    DerivedIndicator('UNIT_VALUE', 'VALUE_IN_EUROS', denominator='CUM_VALUE'),
+)
+
+def derive_indicator(df, indicator, processing_log):
+    """Rows of one derived indicator, computed with whole-column operations"""
+    source_rows = df[df['indicators'] == indicator.source].copy()
+    processing_log.append(f"Found {len(source_rows)} {indicator.source} rows")
+    source_rows['indicators'] = indicator.name
+    
+    if indicator.conversion is not None:
+        source_rows['obs_value'] = source_rows['obs_value'].to_numpy() * indicator.conversion.lookup(source_rows)
+        return source_rows
+    
+    # Join each source row to its denominator row on the full key
+    denominators = (
+        df[df['indicators'] == indicator.denominator]
+        .drop_duplicates(subset=KEY_COLS, keep='first')[KEY_COLS + ['obs_value']]
+        .rename(columns={'obs_value': 'denominator'})
+    )
+    derived_rows = source_rows.merge(denominators, on=KEY_COLS, how='left')
+    
+    # Zero or missing denominator yields 0 instead of skipping the row
+    missing = derived_rows['denominator'].isna() | (derived_rows['denominator'] == 0)
+    processing_log.append(f"{int(missing.sum())} {indicator.name} rows with zero/missing {indicator.denominator}")
+    derived_rows['obs_value'] = (
+        derived_rows['obs_value'] / derived_rows['denominator']
+    ).where(~missing, 0)
+    return derived_rows.drop(columns='denominator')
+
+def derive_indicators(df, processing_log):
+    """Append the rows of every indicator in DERIVED_INDICATORS"""
+    for indicator in DERIVED_INDICATORS:
+        derived_rows = derive_indicator(df, indicator, processing_log)
+        if not derived_rows.empty:
+            df = pd.concat([df, derived_rows], ignore_index=True)
+        processing_log.append(f"After adding {indicator.name}: {len(df)} rows")
+    
+    return df
+
+def content_version(df):
+    """Short hash of the rows of a table, independent of their order.
+    
+    Incremental loads append fetched months after the stored ones, so the
+    same data can come back in a different row order.
+    """
+    row_hashes = np.sort(pd.util.hash_pandas_object(df, index=False).to_numpy())
+    return hashlib.sha256(row_hashes.tobytes()).hexdigest()[:12]
+
+class DataLoadError(Exception):
+    """Loading failed; carries the processing log up to the failure"""
+    
+    def __init__(self, message, processing_log):
+        super().__init__(message)
+        self.processing_log = processing_log
+
+def load_and_process_data(spec=DEFAULT_SPEC, incremental=True, max_store_age=None, trace=None):
+    """Load and process Eurostat data.
+    
+    Returns (df, wide_df, data_version): the long table, its wide indexed
+    form, and a content hash identifying this version of the data. A local
+    store younger than max_store_age seconds (default STORE_MAX_AGE_SECONDS)
+    is used as is; 0 always revalidates it against COMEXT.
+    Callers share the result through DatasetStore rather than calling this
+    per session. Failures raise DataLoadError. Stages are recorded as spans
+    on trace, which also gets the processing log.
+    """
+    processing_log = []
+    if trace is not None:
+        trace.attrs['processing_log'] = processing_log
+    
+    try:
+        periods = spec.periods()
+        with trace_span(trace, 'store_read'):
+            stored_df, store_meta = load_data_store(spec) if incremental else (None, {})
+        store_age = time.time() - store_meta.get('saved_at', 0)
+        if max_store_age is None:
+            max_store_age = STORE_MAX_AGE_SECONDS
+        
+        if stored_df is not None and store_age < max_store_age:
+            processing_log.append(f"Using local store ({store_age:.0f}s old), COMEXT not contacted")
+            df = stored_df
+        else:
+            fetch_periods = select_fetch_periods(stored_df, periods)
+            processing_log.append(f"Fetching {len(fetch_periods)} of {len(periods)} months: {fetch_periods}")
+            
+            raw_df, fetch_metas = (
+                fetch_raw_data(spec, fetch_periods, store_meta.get('fetches', {}), processing_log, trace)
+                if fetch_periods else (None, {})
+            )
+            
+            if raw_df is None:
+                if stored_df is None:
+                    raise ValueError("COMEXT returned no data")
+                processing_log.append("No new data returned, using stored months")
+                df = stored_df[stored_df['time_period'].isin(periods)]
+            else:
+                processing_log.append(f"Raw CSV loaded: {len(raw_df)} rows, {len(raw_df.columns)} columns")
+                
+                # Derived indicators are per key and month, so only fetched months are recomputed
+                with trace_span(trace, 'clean', rows=len(raw_df)):
+                    cleaned_df = clean_raw_data(raw_df, processing_log)
+                with trace_span(trace, 'derive'):
+                    fetched_df = derive_indicators(cleaned_df, processing_log)
+                
+                if stored_df is None:
+                    df = fetched_df
+                else:
+                    fetched_periods = set(fetched_df['time_period'])
+                    kept_df = stored_df[
+                        stored_df['time_period'].isin(periods) &
+                        ~stored_df['time_period'].isin(fetched_periods)
+                    ]
+                    df = pd.concat([kept_df, fetched_df], ignore_index=True)
+                    processing_log.append(f"Merged {len(fetched_df)} fetched rows with {len(kept_df)} stored rows")
+            
+            # Categorical keys keep the long table compact in memory and on disk
+            df = df.astype({col: 'category' for col in CATEGORY_COLS})
+            with trace_span(trace, 'store_write'):
+                save_data_store(spec, df, {'fetches': fetch_metas})
+        
+        # Compact wide table for the generated queries
+        with trace_span(trace, 'wide_table'):
+            wide_df = build_wide_table(df)
+        with trace_span(trace, 'version_hash'):
+            data_version = content_version(df)
+        long_mb = df.memory_usage(deep=True).sum() / 1e6
+        wide_mb = wide_df.memory_usage(deep=True).sum() / 1e6
+        processing_log.append(f"Wide table: {len(wide_df)} rows, {wide_mb:.2f} MB (long table {long_mb:.2f} MB)")
+            
+        return df, wide_df, data_version
+    
+    except Exception as e:
+        raise DataLoadError(str(e), processing_log) from e
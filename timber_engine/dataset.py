@@ -0,0 +1,146 @@
+"""The dataset shared by every session of a server process.
+
+DatasetStore holds one immutable Dataset and replaces it atomically from a
+background thread, so callers never wait for a reload once the first load
+is done and never see data change under a query in flight.
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+import pandas as pd
+
+from timber_engine.data import DEFAULT_SPEC, load_and_process_data
+from timber_engine.tracing import Trace
+
+# One copy of the data per server process, shared read-only by all sessions
+# and rebuilt by a background thread
+DATASET_MAX_AGE_SECONDS = int(os.environ.get('DATASET_MAX_AGE', 3600))
+DATASET_RETRY_SECONDS = int(os.environ.get('DATASET_RETRY', 300))
+# Scheduled reloads start this long before the dataset expires, so the new
+# version is usually in place by then
+DATASET_PREFETCH_LEAD_SECONDS = int(os.environ.get('DATASET_PREFETCH_LEAD', 120))
+
+@dataclass(frozen=True)
+class Dataset:
+    """One loaded version of the data; the frames must not be modified"""
+    df: pd.DataFrame
+    wide_df: pd.DataFrame
+    version: str
+    loaded_at: float
+    trace: Trace = None
+
+class DatasetStore:
+    """Process-wide holder of the current Dataset, swapped atomically on reload.
+    
+    A run takes the current Dataset once and uses it to the end, so a reload
+    never changes data under a query in flight; the previous version is freed
+    when the last run holding it finishes. With prefetch the first load starts
+    on a daemon thread as soon as the store is created and current() waits
+    for it instead of starting its own; without, the first current() loads.
+    After that the thread reloads prefetch_lead_seconds before the dataset
+    is max_age_seconds old (or when asked via request_refresh) and swaps in
+    the result if the data version changed, calling on_swap(previous, dataset).
+    
+    loader(revalidate) returns a Dataset; revalidate is True for every load
+    after the first, which must not be served from a local copy that has not
+    expired yet.
+    """
+    
+    SCHEDULER_POLL_SECONDS = 60
+    
+    def __init__(self, loader, max_age_seconds, retry_seconds=300, on_swap=None, prefetch=False,
+                 prefetch_lead_seconds=0):
+        self.loader = loader
+        self.max_age_seconds = max_age_seconds
+        self.retry_seconds = retry_seconds
+        self.on_swap = on_swap
+        self.prefetch_lead_seconds = min(prefetch_lead_seconds, max_age_seconds)
+        self.created_at = time.time()
+        # Seconds from creating the store to the first dataset being available
+        self.ready_seconds = None
+        self.refreshed_at = None
+        self.last_error = None
+        self.refreshing = False
+        self._dataset = None
+        self._next_refresh_at = self.created_at if prefetch else None
+        self._load_lock = threading.Lock()
+        self._wake = threading.Event()
+        threading.Thread(target=self._run_scheduler, name='dataset-refresher', daemon=True).start()
+    
+    def current(self):
+        """The current Dataset, or None until the first successful load; waits for a load in flight"""
+        if self._dataset is None and not self._waiting_to_retry():
+            with self._load_lock:
+                if self._dataset is None and not self._waiting_to_retry():
+                    self._reload()
+        return self._dataset
+    
+    def request_refresh(self):
+        """Have the background thread reload now; returns immediately"""
+        self.refreshing = True
+        self._wake.set()
+    
+    def _waiting_to_retry(self):
+        return self.last_error is not None and time.time() < self._next_refresh_at
+    
+    def _run_scheduler(self):
+        while True:
+            if self._next_refresh_at is None:
+                timeout = self.SCHEDULER_POLL_SECONDS
+            else:
+                timeout = min(max(self._next_refresh_at - time.time(), 0), self.SCHEDULER_POLL_SECONDS)
+            requested = self._wake.wait(timeout)
+            self._wake.clear()
+            if requested or self._due():
+                with self._load_lock:
+                    # A request may have loaded while this thread waited for the lock
+                    if requested or self._due():
+                        self._reload()
+    
+    def _due(self):
+        return self._next_refresh_at is not None and time.time() >= self._next_refresh_at
+    
+    def _reload(self):
+        self.refreshing = True
+        try:
+            dataset = self.loader(self._dataset is not None)
+        except Exception as e:
+            # Keep serving the previous version and try again later
+            self.last_error = e
+            self._next_refresh_at = time.time() + self.retry_seconds
+            return
+        finally:
+            self.refreshing = False
+        
+        self.last_error = None
+        self.refreshed_at = time.time()
+        if self.ready_seconds is None:
+            self.ready_seconds = self.refreshed_at - self.created_at
+        self._next_refresh_at = self.refreshed_at + self.max_age_seconds - self.prefetch_lead_seconds
+        previous = self._dataset
+        if previous is None or dataset.version != previous.version:
+            self._dataset = dataset
+            if previous is not None and self.on_swap is not None:
+                self.on_swap(previous, dataset)
+
+def load_dataset(spec=DEFAULT_SPEC, query_runner=None, trace_log=None, revalidate=False):
+    """Load a Dataset and have query_runner prepare it before it goes live.
+    
+    revalidate checks the local store against COMEXT even if it has not expired.
+    """
+    trace = Trace('load', spec=spec.cache_key, revalidate=revalidate)
+    try:
+        df, wide_df, data_version = load_and_process_data(
+            spec, max_store_age=0 if revalidate else None, trace=trace
+        )
+        trace.attrs['data_version'] = data_version
+        if query_runner is not None:
+            with trace.span('query_prepare', sandboxed=query_runner.sandbox_pool is not None):
+                query_runner.prepare(df, wide_df, data_version)
+        return Dataset(df, wide_df, data_version, time.time(), trace)
+    finally:
+        trace.finish()
+        if trace_log is not None:
+            trace_log.write(trace)
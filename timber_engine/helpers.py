@@ -0,0 +1,126 @@
+"""Time-series helpers injected into the exec namespace.
+
+make_helpers binds the functions below to one wide table. They work on a
+pre-sorted numpy panel with one series per reporter/partner/product and a
+zero-filled slot per indicator and month, so generated code can ask for
+YTD totals, YoY changes, rolling sums and rankings in one call instead of
+filtering time_period strings by hand.
+
+Filters (reporter, partner, product) take a code, a list of codes or None
+for all. indicator is any wide_df column; UNIT_VALUE is always computed
+as value-weighted VALUE_IN_EUROS / CUM_VALUE over the selection.
+"""
+import numpy as np
+import pandas as pd
+
+VALUE_COL = 'VALUE_IN_EUROS'
+VOLUME_COL = 'CUM_VALUE'
+UNIT_VALUE_COL = 'UNIT_VALUE'
+
+def _as_list(value):
+    return [value] if isinstance(value, str) else list(value)
+
+def make_helpers(wide_df):
+    """Helper functions bound to wide_df, keyed by their namespace name"""
+    months = wide_df.index.get_level_values('time_period')
+    all_months = pd.period_range(months.min(), months.max(), freq='M')
+    latest_month = months.max().month
+    indicators = list(wide_df.columns)
+    
+    # Panel of shape (series, indicator, month), one series per
+    # reporter/partner/product, zero-filled for months without data
+    frame = wide_df.unstack('time_period').fillna(0.0)
+    frame = frame.reindex(columns=pd.MultiIndex.from_product([indicators, all_months]), fill_value=0.0)
+    panel = frame.to_numpy().reshape(len(frame), len(indicators), len(all_months))
+    series_keys = {
+        level: frame.index.get_level_values(level).astype(str).to_numpy()
+        for level in ('reporter', 'partner', 'product')
+    }
+    month_years = all_months.year.to_numpy()
+    month_numbers = all_months.month.to_numpy()
+    
+    def select(reporter=None, partner=None, product=None):
+        """Boolean mask over panel series for the given filters"""
+        mask = np.ones(len(frame), dtype=bool)
+        for level, value in (('reporter', reporter), ('partner', partner), ('product', product)):
+            if value is not None:
+                mask &= np.isin(series_keys[level], _as_list(value))
+        return mask
+    
+    def month_mask(year, ytd):
+        mask = month_years == year
+        if ytd:
+            mask &= month_numbers <= latest_month
+        return mask
+    
+    def ratio_or_value(sums, indicator):
+        """Column for indicator from summed values; UNIT_VALUE as value / volume"""
+        if indicator == UNIT_VALUE_COL:
+            volume = sums[VOLUME_COL]
+            return sums[VALUE_COL] / volume.where(volume > 0)
+        return sums[indicator]
+    
+    def monthly(indicator='CUM_VALUE', reporter=None, partner=None, product=None):
+        """Monthly series over the full period range, zero-filled"""
+        sums = pd.DataFrame(
+            panel[select(reporter, partner, product)].sum(axis=0).T,
+            index=all_months, columns=indicators
+        )
+        return ratio_or_value(sums, indicator).rename(indicator)
+    
+    def period_total(indicator, year, ytd, reporter, partner, product):
+        selected = panel[select(reporter, partner, product)][:, :, month_mask(year, ytd)]
+        sums = pd.Series(selected.sum(axis=(0, 2)), index=indicators)
+        if indicator == UNIT_VALUE_COL:
+            return sums[VALUE_COL] / sums[VOLUME_COL] if sums[VOLUME_COL] > 0 else float('nan')
+        return sums[indicator]
+    
+    def ytd_total(indicator='CUM_VALUE', year=None, reporter=None, partner=None, product=None):
+        """January up to the latest month in the data, for the given (default latest) year"""
+        year = year or all_months.max().year
+        return period_total(indicator, year, True, reporter, partner, product)
+    
+    def annual_total(indicator='CUM_VALUE', year=None, reporter=None, partner=None, product=None):
+        """Full calendar-year total (default latest year, which may be incomplete)"""
+        year = year or all_months.max().year
+        return period_total(indicator, year, False, reporter, partner, product)
+    
+    def yoy_change(indicator='CUM_VALUE', year=None, ytd=True, reporter=None, partner=None, product=None):
+        """Series with current, previous, change and pct_change vs. the previous year"""
+        year = year or all_months.max().year
+        current = period_total(indicator, year, ytd, reporter, partner, product)
+        previous = period_total(indicator, year - 1, ytd, reporter, partner, product)
+        change = current - previous
+        pct_change = change / previous * 100 if previous else float('nan')
+        return pd.Series({'current': current, 'previous': previous, 'change': change, 'pct_change': pct_change})
+    
+    def rolling_sum(indicator='CUM_VALUE', months=12, reporter=None, partner=None, product=None):
+        """Trailing sum over `months` months (e.g. 3 or 12), NaN until the window is full.
+        
+        For UNIT_VALUE, the value-weighted price over the window: summed value / summed volume.
+        """
+        if indicator == UNIT_VALUE_COL:
+            value = rolling_sum(VALUE_COL, months, reporter, partner, product)
+            volume = rolling_sum(VOLUME_COL, months, reporter, partner, product)
+            return (value / volume.where(volume > 0)).rename(indicator)
+        return monthly(indicator, reporter, partner, product).rolling(months).sum()
+    
+    def rank_reporters(partner=None, indicator='CUM_VALUE', year=None, ytd=False, product=None, top=None):
+        """Reporters ordered by their total to the partner(s), largest first"""
+        year = year or all_months.max().year
+        mask = select(partner=partner, product=product)
+        per_series = panel[mask][:, :, month_mask(year, ytd)].sum(axis=2)
+        sums = pd.DataFrame(per_series, index=series_keys['reporter'][mask], columns=indicators)
+        sums = sums.groupby(level=0).sum()
+        sums.index.name = 'reporter'
+        ranking = ratio_or_value(sums, indicator).rename(indicator).sort_values(ascending=False)
+        return ranking.head(top) if top else ranking
+    
+    return {
+        'monthly': monthly,
+        'ytd_total': ytd_total,
+        'annual_total': annual_total,
+        'yoy_change': yoy_change,
+        'rolling_sum': rolling_sum,
+        'rank_reporters': rank_reporters,
+    }
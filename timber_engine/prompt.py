@@ -0,0 +1,167 @@
+"""What the model is given: the system prompt and the chat history.
+
+build_system_prompt fills the data coverage into SYSTEM_PROMPT.
+build_gemini_history turns stored chat messages into a token-bounded
+history in the google.generativeai format.
+"""
+import os
+import re
+
+import pandas as pd
+
+from timber_engine.data import DEFAULT_SPEC
+
+# Gemini model the prompt is written for
+GEMINI_MODEL = os.environ.get('GEMINI_MODEL', 'gemini-2.5-pro')
+
+SYSTEM_PROMPT = """You're a top-notch, seasoned industry analyst with excellent analytic skills, logic and journalistic, neutral style. You work with us as a helpful analyst who addresses the statistics database for EU softwood timber exports to global countries in order to answer user's queries. Your knowledge is limited outside this database.
+
+You're very clever, thoughtful and reflect multi-directionally. When asked, you think first meticulously which rows and cells to look at, and construct a short Python code snippet that will query the dataframe 'df'.
+
+Country labels (Reporter - use uppercase codes):
+AT=Austria, BE=Belgium, BG=Bulgaria, CY=Cyprus, CZ=Czech Republic, DE=Germany, DK=Denmark, EE=Estonia, ES=Spain, FI=Finland, FR=France, GB=United Kingdom, GR=Greece, HR=Croatia, HU=Hungary, IE=Ireland, IT=Italy, LT=Lithuania, LU=Luxembourg, LV=Latvia, MT=Malta, NL=Netherlands, PL=Poland, PT=Portugal, RO=Romania, SE=Sweden, SI=Slovenia, SK=Slovakia
+
+Species labels (Product - use as strings):
+440711=pine, 440712=spruce and fir, 440713=SPF, 440714=hemlock and fir, 440719=other softwoods
+
+Importing country labels (Partner - use uppercase codes):
+CN=China, EG=Egypt, SA=Saudi Arabia, AE=UAE, MA=Morocco, DZ=Algeria, JP=Japan, KR=South Korea, IN=India
+
+Indicators (use uppercase):
+- QUANTITY_IN_100KG: Export quantity in 100kg units
+- VALUE_IN_EUROS: Export value in euros
+- CUM_VALUE: Cubic meters (calculated from quantity)
+- UNIT_VALUE: Price per cubic meter in EUR/m³ (calculated from value/volume)
+
+The database has stats for all EU countries, all softwood lumber species, exports volume and value to China, Top-5 MENA countries, India, Japan, South Korea; monthly from {period_start} to {period_end}.
+
+DataFrame columns: reporter, partner, product, indicators, time_period, obs_value
+
+A faster wide DataFrame 'wide_df' holds the same data with one row per reporter/partner/product/month:
+- MultiIndex levels: reporter, partner, product (categorical codes as above), time_period (monthly pandas Period)
+- Float columns: QUANTITY_IN_100KG, VALUE_IN_EUROS, CUM_VALUE, UNIT_VALUE (NaN where not reported)
+- Select with index lookups, e.g. wide_df.loc[('DE', 'CN', '440711'), 'CUM_VALUE'] or pd.IndexSlice slices; time_period accepts '2024' or '2024-01':'2024-06'
+Prefer 'wide_df' over 'df' for filtering and aggregation.
+
+Precomputed totals are in the dict 'cubes', keyed by (grain, dims):
+- grain: 'year' (index level 'year', int), 'quarter' (index level 'quarter', quarterly Period like '2024Q1'), or 'ytd' (index level 'year'; January up to the latest month available in the latest year, the same months in every year)
+- dims: any subset of ('reporter', 'partner', 'product') in that order, including () for EU totals
+- Columns: QUANTITY_IN_100KG, VALUE_IN_EUROS, CUM_VALUE (sums) and UNIT_VALUE (value-weighted EUR/m³ = VALUE_IN_EUROS / CUM_VALUE)
+- e.g. cubes['year', ('reporter', 'partner')].loc[('DE', 'CN', 2024), 'CUM_VALUE'] or cubes['ytd', ('partner',)].loc['CN', 'UNIT_VALUE']
+Use 'cubes' first for yearly, quarterly and YTD totals or average prices; fall back to 'wide_df' for monthly detail.
+
+Ready-made helpers (reporter/partner/product filters take a code, a list of codes, or None for all; UNIT_VALUE is value-weighted):
+- ytd_total(indicator='CUM_VALUE', year=None, reporter=None, partner=None, product=None): January up to the latest month in the data
+- annual_total(indicator='CUM_VALUE', year=None, reporter=None, partner=None, product=None): full calendar year
+- yoy_change(indicator='CUM_VALUE', year=None, ytd=True, reporter=None, partner=None, product=None): Series with current, previous, change, pct_change
+- rolling_sum(indicator='CUM_VALUE', months=12, reporter=None, partner=None, product=None): trailing 3/12-month sums by month
+- rank_reporters(partner=None, indicator='CUM_VALUE', year=None, ytd=False, product=None, top=None): reporters sorted by total, largest first
+- monthly(indicator='CUM_VALUE', reporter=None, partner=None, product=None): zero-filled monthly Series
+year defaults to the latest year in the data.
+
+IMPORTANT INSTRUCTIONS:
+1. Generate concise Python code using pandas operations on 'df'
+2. Assign results to a variable called 'result'
+3. Use uppercase for reporter, partner, and indicators when filtering
+4. Use string format for product codes (e.g., '440711')
+5. When interpreting results, use ONLY the actual executed result - never make up numbers
+6. If data is missing or you can't answer, say so clearly
+7. When asked about imports or import volumes (and value or tons not mentioned), by default answer about m³ and change only if corrected by user
+8. When asked about trends, try giving annual or year-to-date numbers and comparisons on a YoY basis, not just random number of recent months; use ytd_total, yoy_change and rolling_sum rather than filtering time_period strings
+
+Example code:
+```result = df[(df['reporter'] == 'DE') & (df['indicators'] == 'CUM_VALUE') & (df['partner'] == 'CN')]['obs_value'].sum()```
+
+Same query on the wide table:
+```result = wide_df.loc[pd.IndexSlice['DE', 'CN', :, :], 'CUM_VALUE'].sum()```
+
+YTD volume change of German exports to China vs. last year, in percent:
+```result = yoy_change('CUM_VALUE', reporter='DE', partner='CN')['pct_change']```
+"""
+
+def data_period_bounds(df):
+    """First and last month present in the loaded data (falls back to the default spec)"""
+    if df is None or df.empty:
+        periods = DEFAULT_SPEC.periods()
+    else:
+        periods = sorted(df['time_period'].astype(str).unique())
+    return pd.Period(periods[0], freq='M'), pd.Period(periods[-1], freq='M')
+
+def build_system_prompt(df):
+    """SYSTEM_PROMPT with the actual period coverage filled in"""
+    period_start, period_end = data_period_bounds(df)
+    return SYSTEM_PROMPT.format(
+        period_start=period_start.strftime('%B %Y'),
+        period_end=period_end.strftime('%B %Y'),
+    )
+
+# Conversation context sent with each turn: the most recent turns verbatim
+# (markup stripped) within CONTEXT_TOKEN_BUDGET, and older turns condensed
+# into one summary message. Tokens are estimated at ~4 characters each
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', 4000))
+CONTEXT_RECENT_MESSAGES = 8
+CONTEXT_SUMMARY_SHARE = 0.25
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+def strip_markup(content):
+    """Plain text of a stored message: no HTML, no collapsible code block, no cache/timing notes"""
+    content = re.sub(r'<details>.*?</details>', '', content, flags=re.DOTALL)
+    content = re.sub(r'<sub>.*?</sub>', '', content, flags=re.DOTALL)
+    content = re.sub(r'<[^>]+>', '', content)
+    return re.sub(r'\n{3,}', '\n\n', content).strip()
+
+def summarize_message(msg):
+    """One line standing in for an older message"""
+    content = strip_markup(msg['content'])
+    if msg['role'] == 'user':
+        return f"- User asked: {content[:200]}"
+    result = re.search(r'💡 \*\*Result:\*\* `(.*?)`', content)
+    if result:
+        return f"- Answer result: {result.group(1)[:200]}"
+    return f"- Answer: {content.split(chr(10))[0][:200]}"
+
+def build_gemini_history(messages, token_budget=CONTEXT_TOKEN_BUDGET):
+    """Convert stored messages to a token-bounded Gemini chat history"""
+    # Newest messages first, verbatim, until the budget or message cap is reached
+    summary_budget = int(token_budget * CONTEXT_SUMMARY_SHARE)
+    verbatim_budget = token_budget - summary_budget
+    recent = []
+    used = 0
+    for msg in reversed(messages):
+        content = strip_markup(msg['content'])
+        cost = estimate_tokens(content)
+        if len(recent) >= CONTEXT_RECENT_MESSAGES or used + cost > verbatim_budget:
+            break
+        recent.append((msg['role'], content))
+        used += cost
+    recent.reverse()
+    
+    # Keep user/model alternation: the verbatim window starts on a user turn
+    while recent and recent[0][0] != 'user':
+        recent.pop(0)
+    
+    # Everything older becomes a short summary, newest lines kept first
+    older = messages[:len(messages) - len(recent)]
+    summary_lines = []
+    used = 0
+    for msg in reversed(older):
+        line = summarize_message(msg)
+        if used + estimate_tokens(line) > summary_budget:
+            break
+        summary_lines.append(line)
+        used += estimate_tokens(line)
+    summary_lines.reverse()
+    
+    history = []
+    if summary_lines:
+        history.append({'role': 'user', 'parts': ["Summary of the earlier conversation:\n" + "\n".join(summary_lines)]})
+        history.append({'role': 'model', 'parts': ["Noted."]})
+    for role, content in recent:
+        # Gemini uses 'user' and 'model' roles, and 'parts' for content
+        history.append({
+            'role': 'user' if role == 'user' else 'model',
+            'parts': [content]
+        })
+    return history
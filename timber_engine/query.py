@@ -0,0 +1,126 @@
+"""Running generated code against a data version, with a result cache.
+
+QueryRunner sends snippets to a SandboxPool or, without one, runs them
+in-process with the cubes and helpers built once per data version. Results
+are cached on the AST of the code plus the data version, so snippets that
+differ only in formatting or comments share an entry.
+"""
+import ast
+import os
+import threading
+from collections import OrderedDict
+
+from timber_engine.sandbox import build_query_extras, execute_code, is_execution_error
+
+QUERY_CACHE_SIZE = 256
+
+# Generated code runs in a pool of worker processes with a wall-clock timeout
+# and memory cap; SANDBOX_WORKERS=0 runs it in-process as before
+SANDBOX_WORKERS = int(os.environ.get('SANDBOX_WORKERS', 2))
+SANDBOX_TIMEOUT_SECONDS = int(os.environ.get('SANDBOX_TIMEOUT', 10))
+SANDBOX_MEMORY_LIMIT_MB = int(os.environ.get('SANDBOX_MEMORY_LIMIT_MB', 2048))
+
+class QueryCache:
+    """Thread-safe LRU of execute_code results with hit/miss counters"""
+    
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+            self.misses += 1
+            return False, None
+    
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'maxsize': self.maxsize}
+
+def normalize_code(code_str):
+    """Canonical form of a snippet: its AST dump, ignoring whitespace and comments"""
+    try:
+        return ast.dump(ast.parse(code_str))
+    except SyntaxError:
+        return None
+
+class QueryRunner:
+    """Cached execution of snippets, in a sandbox pool or in-process"""
+    
+    # In-process extras kept: the current data version and the one before it
+    KEPT_EXTRAS = 2
+    
+    def __init__(self, cache=None, sandbox_pool=None):
+        self.cache = cache if cache is not None else QueryCache(QUERY_CACHE_SIZE)
+        self.sandbox_pool = sandbox_pool
+        self._extras = OrderedDict()
+        self._extras_lock = threading.Lock()
+        self._build_locks = {}
+    
+    def extras(self, data_version, wide_df):
+        """Cubes and helpers for in-process execution, built once per data version.
+        
+        The build runs outside _extras_lock, so queries on other versions
+        are not held up by it; callers of the same version wait for one build.
+        """
+        with self._extras_lock:
+            if data_version in self._extras:
+                return self._extras[data_version]
+            build_lock = self._build_locks.setdefault(data_version, threading.Lock())
+        with build_lock:
+            with self._extras_lock:
+                if data_version in self._extras:
+                    return self._extras[data_version]
+            extras = build_query_extras(wide_df)
+            with self._extras_lock:
+                self._extras[data_version] = extras
+                while len(self._extras) > self.KEPT_EXTRAS:
+                    self._extras.popitem(last=False)
+                self._build_locks.pop(data_version, None)
+            return extras
+    
+    def prepare(self, df, wide_df, data_version):
+        """Get a new data version ready before it goes live: its sandbox snapshot or in-process extras"""
+        if self.sandbox_pool is None:
+            self.extras(data_version, wide_df)
+        else:
+            self.sandbox_pool.publish(df, wide_df, data_version)
+    
+    def execute(self, code_str, df, wide_df, data_version):
+        """Run a snippet in the sandbox pool, or in-process when there is none"""
+        if self.sandbox_pool is None:
+            return execute_code(code_str, df, wide_df, self.extras(data_version, wide_df))
+        return self.sandbox_pool.run(code_str, df, wide_df, data_version)
+    
+    def run(self, code_str, df, wide_df, data_version):
+        """execute behind the query cache; errors are not cached"""
+        normalized = normalize_code(code_str)
+        if normalized is None:
+            return self.execute(code_str, df, wide_df, data_version)
+        
+        key = (normalized, data_version)
+        hit, result = self.cache.get(key)
+        if hit:
+            return result
+        
+        result = self.execute(code_str, df, wide_df, data_version)
+        if not is_execution_error(result):
+            self.cache.put(key, result)
+        return result
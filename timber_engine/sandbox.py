@@ -0,0 +1,227 @@
+"""Execution of model-generated pandas code.
+
+execute_code runs a snippet in-process. SandboxPool runs snippets in a pool
+of pre-started worker processes that memory-map the current dataset from an
+Arrow snapshot (building the query extras once per version), enforce a
+wall-clock timeout (the worker is killed and replaced) and an address-space
+cap, and send the result back pickled.
+"""
+import atexit
+import multiprocessing
+import queue
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+import pyarrow.feather as feather
+
+from timber_engine.cubes import build_cubes
+from timber_engine.data import replace_file
+from timber_engine.helpers import make_helpers
+
+try:
+    import resource
+except ImportError:  # Windows: no memory cap
+    resource = None
+
+ERROR_PREFIX = "⚠️ Error executing code"
+
+# Snapshots kept on disk: the current version and the one before it, so
+# queries that started before a swap can still run against their data
+KEPT_SNAPSHOTS = 2
+
+def is_execution_error(result):
+    """True for the error message execute_code returns instead of raising"""
+    return isinstance(result, str) and result.startswith(ERROR_PREFIX)
+
+def build_query_extras(wide_df):
+    """Names added to the exec namespace next to df, wide_df and pd"""
+    return {'cubes': build_cubes(wide_df), **make_helpers(wide_df)}
+
+def copy_cubes(cubes):
+    """New dict of shallow cube copies, so a snippet cannot change the shared ones"""
+    return {key: cube.copy(deep=False) for key, cube in cubes.items()}
+
+def execute_code(code_str, df, wide_df=None, extras=None):
+    """Safely execute code generated by AI.
+    
+    The snippet gets shallow copies of df, wide_df and the cubes (in a new
+    dict): with Copy-on-Write, whatever it assigns to them stays local, so
+    frames shared between calls are never modified.
+    """
+    try:
+        local_vars = {
+            **(extras or {}),
+            'df': df.copy(deep=False),
+            'wide_df': wide_df.copy(deep=False) if wide_df is not None else None,
+            'pd': pd,
+        }
+        if 'cubes' in local_vars:
+            local_vars['cubes'] = copy_cubes(local_vars['cubes'])
+        exec(code_str, {"__builtins__": {}}, local_vars)
+        if 'result' in local_vars:
+            return local_vars['result']
+        return None
+    except MemoryError:
+        return f"{ERROR_PREFIX}: memory limit exceeded"
+    except Exception as e:
+        return f"{ERROR_PREFIX}: {str(e)}"
+
+def read_snapshot(df_path, wide_path, index_cols):
+    """Memory-map a published dataset snapshot"""
+    df = feather.read_table(df_path, memory_map=True).to_pandas()
+    wide_df = feather.read_table(wide_path, memory_map=True).to_pandas().set_index(index_cols)
+    return df, wide_df
+
+def _worker_main(conn, memory_limit_bytes):
+    """Worker loop: (version, paths, code) in, ('ok' | 'error', payload) out"""
+    if resource is not None and memory_limit_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit_bytes, memory_limit_bytes))
+    
+    loaded_version = None
+    df = wide_df = extras = None
+    while True:
+        message = conn.recv()
+        if message is None:
+            return
+        version, paths, code_str = message
+        try:
+            if version != loaded_version:
+                df, wide_df = read_snapshot(*paths)
+                extras = build_query_extras(wide_df)
+                loaded_version = version
+            reply = ('ok', execute_code(code_str, df, wide_df, extras) if code_str is not None else None)
+        except MemoryError:
+            reply = ('error', "memory limit exceeded")
+        except Exception as e:
+            reply = ('error', str(e))
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # Results that cannot be pickled
+            conn.send(('error', f"result could not be returned: {e}"))
+
+class SandboxPool:
+    """Pre-started worker processes executing snippets against a shared snapshot.
+    
+    Snapshots go to a directory of this pool's own under snapshot_root, so
+    other processes using the same root (a batch run, a second replica, an
+    overlapping restart) never overwrite or delete them. close() removes the
+    directory, as does a normal interpreter exit.
+    """
+    
+    def __init__(self, workers, snapshot_root, index_cols, timeout_seconds=10, memory_limit_mb=2048):
+        Path(snapshot_root).mkdir(parents=True, exist_ok=True)
+        self.snapshot_dir = Path(tempfile.mkdtemp(prefix='pool-', dir=snapshot_root))
+        atexit.register(shutil.rmtree, self.snapshot_dir, ignore_errors=True)
+        self.index_cols = list(index_cols)
+        self.timeout_seconds = timeout_seconds
+        self.memory_limit_bytes = memory_limit_mb * 1024 * 1024 if memory_limit_mb else None
+        self._context = multiprocessing.get_context('spawn')
+        self.workers = workers
+        self._idle = queue.Queue()
+        # Serializes publishing new versions; run() on a published version never waits for it
+        self._publish_lock = threading.Lock()
+        self._snapshots = OrderedDict()
+        for _ in range(workers):
+            self._idle.put(self._start_worker())
+    
+    def _start_worker(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main, args=(child_conn, self.memory_limit_bytes), daemon=True
+        )
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+    
+    def _replace_worker(self, worker):
+        process, conn = worker
+        process.kill()
+        process.join()
+        conn.close()
+        return self._start_worker()
+    
+    def publish(self, df, wide_df, version):
+        """Write the snapshot for a data version (once) and make it current.
+        
+        Queries on versions already published keep running meanwhile: they
+        do not take the publish lock, and idle workers are warmed one at a
+        time.
+        """
+        if version in self._snapshots:
+            return
+        with self._publish_lock:
+            if version in self._snapshots:
+                return
+            df_path = self.snapshot_dir / f"long_{version}.arrow"
+            wide_path = self.snapshot_dir / f"wide_{version}.arrow"
+            for frame, path in ((df, df_path), (wide_df.reset_index(), wide_path)):
+                replace_file(
+                    path,
+                    lambda tmp_path: feather.write_feather(
+                        frame.reset_index(drop=True), tmp_path, compression='uncompressed'
+                    )
+                )
+            
+            self._snapshots[version] = (str(df_path), str(wide_path), self.index_cols)
+            while len(self._snapshots) > KEPT_SNAPSHOTS:
+                # Removed snapshots stay readable by workers that still map them
+                _, (old_df_path, old_wide_path, _) = self._snapshots.popitem(last=False)
+                Path(old_df_path).unlink(missing_ok=True)
+                Path(old_wide_path).unlink(missing_ok=True)
+            
+            self._warm_idle_workers(version)
+    
+    def _warm_idle_workers(self, version):
+        """Have idle workers map a new snapshot before their next query, one worker at a time"""
+        paths = self._snapshots.get(version)
+        for _ in range(self.workers):
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            process, conn = worker
+            conn.send((version, paths, None))
+            if not conn.poll(self.timeout_seconds):
+                worker = self._replace_worker(worker)
+            else:
+                conn.recv()
+            self._idle.put(worker)
+    
+    def run(self, code_str, df, wide_df, version):
+        """Execute a snippet in a worker against the given data version.
+        
+        Errors come back as execute_code-style messages.
+        """
+        self.publish(df, wide_df, version)
+        paths = self._snapshots.get(version)
+        worker = self._idle.get()
+        process, conn = worker
+        try:
+            conn.send((version, paths, code_str))
+            if not conn.poll(self.timeout_seconds):
+                worker = self._replace_worker(worker)
+                return f"{ERROR_PREFIX}: timed out after {self.timeout_seconds}s"
+            status, payload = conn.recv()
+        except (EOFError, OSError):
+            # The worker died (e.g. killed by the OS); start a fresh one
+            worker = self._replace_worker(worker)
+            return f"{ERROR_PREFIX}: worker process exited"
+        finally:
+            self._idle.put(worker)
+        
+        if status == 'error':
+            return f"{ERROR_PREFIX}: {payload}"
+        return payload
+    
+    def close(self):
+        while not self._idle.empty():
+            process, conn = self._idle.get()
+            conn.send(None)
+            process.join(timeout=1)
+            conn.close()
+        shutil.rmtree(self.snapshot_dir, ignore_errors=True)
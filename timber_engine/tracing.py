@@ -0,0 +1,91 @@
+"""Where a chat turn or a data load spends its time.
+
+A Trace collects named spans (offset from the start of the trace, duration
+and free-form attributes); spans may be recorded from several threads.
+TraceLog appends finished traces to a file as one JSON object per line,
+rotating it when it grows past a size limit.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+class Trace:
+    """Spans recorded for one unit of work, e.g. kind='turn' or kind='load'"""
+    
+    def __init__(self, kind, **attrs):
+        self.kind = kind
+        self.attrs = dict(attrs)
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.spans = []
+        self.duration = None
+    
+    @contextmanager
+    def span(self, name, **attrs):
+        """Time the enclosed block; keys added to the yielded dict are kept"""
+        span = {'name': name, 'start': time.perf_counter() - self._started, **attrs}
+        try:
+            yield span
+        except Exception as e:
+            span['error'] = str(e)
+            raise
+        finally:
+            span['duration'] = time.perf_counter() - self._started - span['start']
+            self.spans.append(span)
+    
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self._started
+    
+    def finish(self):
+        """Fix the total duration; later calls keep the first value"""
+        if self.duration is None:
+            self.duration = self.elapsed
+    
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'started_at': self.started_at,
+            'duration': self.elapsed if self.duration is None else self.duration,
+            **self.attrs,
+            'spans': sorted(self.spans, key=lambda span: span['start']),
+        }
+
+def trace_span(trace, name, **attrs):
+    """trace.span(...), or a no-op block yielding a throwaway dict when trace is None"""
+    if trace is None:
+        return nullcontext(dict(attrs))
+    return trace.span(name, **attrs)
+
+class TraceLog:
+    """Append-only JSON lines file of finished traces.
+    
+    Once the file reaches max_bytes it is renamed to <name>.1, replacing
+    the previous one, and a new file is started; at most about twice
+    max_bytes is kept. max_bytes=None never rotates.
+    """
+    
+    def __init__(self, path, max_bytes=10 * 1024 * 1024):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+    
+    def _rotate_if_full(self):
+        if self.max_bytes is None:
+            return
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            return
+        if size >= self.max_bytes:
+            self.path.replace(self.path.with_name(self.path.name + '.1'))
+    
+    def write(self, trace):
+        line = json.dumps(trace.to_dict(), default=str)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._rotate_if_full()
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')